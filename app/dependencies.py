@@ -1,11 +1,11 @@
 from typing import Annotated, Optional
 
-import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 
-from app.utils.auth_utils import ALGORITHM, JWT_SECRET_KEY, get_user
+from app.utils.auth_utils import decode_access_token, get_user
+from app.utils.db_utils import run_db
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="users/login")
 
@@ -21,15 +21,19 @@ async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    # imported here so jwt stays out of cold starts, see auth_utils
+    from jwt import InvalidTokenError
+
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+        # verified tokens are cached until they expire
+        payload = decode_access_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
         token_data = TokenData(email=email)
-    except jwt.exceptions.InvalidTokenError:
+    except InvalidTokenError:
         raise credentials_exception
-    user = get_user(email=token_data.email)
+    user = await run_db(get_user, email=token_data.email)
     if user is None:
         raise credentials_exception
     return user
@@ -1,18 +1,54 @@
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 
-from app.routers import (
-    developer,
-    favourites,
-    game,
-    genre,
-    platform,
-    publisher,
-    token,
-    users,
+from app.pymysql.databaseConnection import (
+    PoolTimeoutError,
+    close_pool,
+    get_replicas,
+)
+from app.routers import ROUTERS, import_router
+from app.utils.auth_utils import (
+    password_jobs,
+    shutdown_password_executor,
+    token_cache,
+    user_cache,
 )
+from app.utils.cache import reference_cache
+from app.utils.compression import CompressionMiddleware, compressed_cache
+from app.utils.db_routing import ReadRoutingMiddleware
+from app.utils.db_utils import shutdown_db_executor
+from app.utils.etag import ETagMiddleware
+from app.utils.lazy_routers import LazyRouterMiddleware
+from app.utils.metrics import CallbackMetric, MetricsMiddleware, registry
+from app.utils.popularity import favourite_reconciler
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# build the routers on first use instead of at import. on by default on
+# vercel, where every cold start is on the path of a user's request
+LAZY_ROUTERS = os.getenv("LAZY_ROUTERS", "1" if os.getenv("VERCEL") else "0") == "1"
+
+
+# start checking the read replicas, if there are any, and reconciling the
+# favourite counts on startup. stop them and the password and database
+# workers, and close the pooled connections on shutdown
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_replicas()
+    favourite_reconciler.start()
+    yield
+    favourite_reconciler.stop()
+    shutdown_password_executor()
+    shutdown_db_executor()
+    close_pool()
+
 
-app = FastAPI()
+# responses are serialised with orjson, which is much quicker than json
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 # cors stuff. must change allow_origin to github later
 app.add_middleware(
     CORSMiddleware,
@@ -21,7 +57,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["Content-Type", "Authorization"],
+    expose_headers=["ETag"],
 )
+# adds etags to the cacheable GET responses
+app.add_middleware(ETagMiddleware)
+# gzip (or brotli) for larger responses. added after ETagMiddleware so it sees
+# the etag that compressed bodies are cached under
+app.add_middleware(CompressionMiddleware)
+# sends reads to the replicas when MYSQL_REPLICA_HOSTS is set
+app.add_middleware(ReadRoutingMiddleware)
+if LAZY_ROUTERS:
+    app.add_middleware(LazyRouterMiddleware, fastapi_app=app)
+# request latency per route, added last so it also times the other middleware
+app.add_middleware(MetricsMiddleware)
+
+
+# every pooled connection stayed busy for MYSQL_POOL_TIMEOUT seconds. that is
+# load, not a fault, so ask the client to try again instead of sending a 500
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request, exc):
+    return ORJSONResponse(
+        status_code=503,
+        content={"detail": {"success": False, "message": "The server is busy"}},
+        headers={"Retry-After": "1"},
+    )
 
 
 @app.get("/")
@@ -29,12 +88,107 @@ def root():
     return {"message": "Welcome to the RetroGame API"}
 
 
+# hit and miss counters for the in-process caches
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "reference": reference_cache.stats(),
+        "users": user_cache.stats(),
+        "tokens": token_cache.stats(),
+        "compressed": compressed_cache.stats(),
+    }
+
+
+# export the cache counters above on /metrics, read at scrape time
+def cache_counter(stat):
+    return lambda: {
+        ("reference",): reference_cache.stats()[stat],
+        ("users",): user_cache.stats()[stat],
+        ("tokens",): token_cache.stats()[stat],
+        ("compressed",): compressed_cache.stats()[stat],
+    }
+
+
+for stat, metric_type in (
+    ("hits", "counter"),
+    ("misses", "counter"),
+    ("evictions", "counter"),
+    ("size", "gauge"),
+):
+    suffix = "_total" if metric_type == "counter" else ""
+    registry.register(
+        CallbackMetric(
+            f"retrogame_cache_{stat}{suffix}",
+            metric_type,
+            f"In-process cache {stat}",
+            ("cache",),
+            cache_counter(stat),
+        )
+    )
+
+registry.register(
+    CallbackMetric(
+        "retrogame_password_jobs",
+        "gauge",
+        "Password hashing jobs running or queued",
+        (),
+        lambda: {(): password_jobs()},
+    )
+)
+
+registry.register(
+    CallbackMetric(
+        "retrogame_favourite_counts_corrected_total",
+        "counter",
+        "Game favourite counts corrected by the reconciliation",
+        (),
+        lambda: {(): favourite_reconciler.corrected},
+    )
+)
+
+
+# health and lag of each read replica, as seen by the last health check
+def replica_gauge(attribute):
+    def collect():
+        replicas = get_replicas()
+        if replicas is None:
+            return {}
+        return {
+            (replica.name,): float(getattr(replica, attribute))
+            for replica in replicas.replicas
+            if getattr(replica, attribute) is not None
+        }
+
+    return collect
+
+
+registry.register(
+    CallbackMetric(
+        "retrogame_db_replica_healthy",
+        "gauge",
+        "1 if the replica is taking reads",
+        ("replica",),
+        replica_gauge("healthy"),
+    )
+)
+registry.register(
+    CallbackMetric(
+        "retrogame_db_replica_lag_seconds",
+        "gauge",
+        "Replication lag at the last health check",
+        ("replica",),
+        replica_gauge("lag"),
+    )
+)
+
+
+# request, query and cache metrics in the prometheus text format
+@app.get("/metrics")
+def metrics():
+    return Response(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
 # Register the routers
-app.include_router(users.router)
-app.include_router(platform.router)
-app.include_router(genre.router)
-app.include_router(developer.router)
-app.include_router(publisher.router)
-app.include_router(game.router)
-app.include_router(favourites.router)
-app.include_router(token.router)
+if not LAZY_ROUTERS:
+    for name in ROUTERS:
+        app.include_router(import_router(name))
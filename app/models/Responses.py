@@ -0,0 +1,294 @@
+from pydantic import BaseModel
+from typing import Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+# successful responses keep the {"detail": {...}} shape they had when the
+# routes raised HTTPException with status 200, so clients reading
+# response.detail carry on working
+class Detail(BaseModel, Generic[T]):
+    detail: T
+
+
+# reply to a write, e.g. {"success": true, "message": "Genre added successfully"}
+class Message(BaseModel):
+    success: bool
+    message: str
+
+
+# login and token refresh
+class Tokens(BaseModel):
+    success: bool
+    access_token: str
+    refresh_token: str
+
+
+# rows of the lookup tables
+class PlatformRow(BaseModel):
+    platform_id: int
+    name: str
+    logo_url: Optional[str] = None
+
+
+class GenreRow(BaseModel):
+    genre_id: int
+    name: str
+
+
+class DeveloperRow(BaseModel):
+    developer_id: int
+    name: str
+
+
+class PublisherRow(BaseModel):
+    publisher_id: int
+    name: str
+
+
+# the lookup table lists and their *-data/{id} routes. the row is None when
+# the id does not exist
+class Rows(BaseModel, Generic[T]):
+    success: bool
+    rows: list[T]
+
+
+class PlatformData(BaseModel):
+    success: bool
+    platform: Optional[PlatformRow]
+
+
+class GenreData(BaseModel):
+    success: bool
+    genre: Optional[GenreRow]
+
+
+class DeveloperData(BaseModel):
+    success: bool
+    developer: Optional[DeveloperRow]
+
+
+class PublisherData(BaseModel):
+    success: bool
+    publisher: Optional[PublisherRow]
+
+
+# a row of the game table
+class GameRow(BaseModel):
+    game_id: int
+    title: str
+    description: str
+    release_year: int
+    genre_id: int
+    platform_id: int
+    publisher_id: int
+    developer_id: int
+    image_url: Optional[str] = None
+
+
+# a game with the names of its genre, platform, publisher and developer, and
+# how it has been rated
+class GameDetails(GameRow):
+    genre_name: str
+    platform_name: str
+    publisher_name: str
+    developer_name: str
+    rating_count: int
+    # None until the game has been rated
+    average_rating: Optional[float] = None
+
+
+class SearchResult(GameRow):
+    relevance: float
+
+
+class PopularGame(GameDetails):
+    favourite_count: int
+
+
+# the per entity listings (/platform/{id} etc.) each leave out the entity
+# they are listing
+class ListedGame(BaseModel):
+    game_id: int
+    game_title: str
+    image_url: Optional[str] = None
+
+
+class PlatformGame(ListedGame):
+    genre_id: int
+    genre_name: str
+    developer_id: int
+    developer_name: str
+    publisher_id: int
+    publisher_name: str
+
+
+class GenreGame(ListedGame):
+    platform_id: int
+    platform_name: str
+    developer_id: int
+    developer_name: str
+    publisher_id: int
+    publisher_name: str
+
+
+class DeveloperGame(ListedGame):
+    genre_id: int
+    genre_name: str
+    platform_id: int
+    platform_name: str
+    publisher_id: int
+    publisher_name: str
+
+
+class PublisherGame(ListedGame):
+    genre_id: int
+    genre_name: str
+    platform_id: int
+    platform_name: str
+    developer_id: int
+    developer_name: str
+
+
+class PlatformGames(BaseModel):
+    success: bool
+    games: list[PlatformGame]
+    platform_name: str
+    next_cursor: Optional[str]
+
+
+class GenreGames(BaseModel):
+    success: bool
+    games: list[GenreGame]
+    genre_name: str
+    next_cursor: Optional[str]
+
+
+class DeveloperGames(BaseModel):
+    success: bool
+    games: list[DeveloperGame]
+    developer_name: str
+    next_cursor: Optional[str]
+
+
+class PublisherGames(BaseModel):
+    success: bool
+    games: list[PublisherGame]
+    publisher_name: str
+    next_cursor: Optional[str]
+
+
+# facet counts on the first page of /games/
+class GenreFacet(BaseModel):
+    genre_id: int
+    count: int
+
+
+class PlatformFacet(BaseModel):
+    platform_id: int
+    count: int
+
+
+class DecadeFacet(BaseModel):
+    decade: int
+    count: int
+
+
+class GameFacets(BaseModel):
+    genre: list[GenreFacet]
+    platform: list[PlatformFacet]
+    decade: list[DecadeFacet]
+
+
+class GamesPage(BaseModel):
+    success: bool
+    rows: list[GameRow]
+    next_cursor: Optional[str]
+    facets: Optional[GameFacets]
+
+
+class GameSearch(BaseModel):
+    success: bool
+    games: list[SearchResult]
+    next_offset: Optional[int]
+
+
+class GameBatch(BaseModel):
+    success: bool
+    games: list[GameDetails]
+    missing: list[int]
+
+
+# the most favourited games, most first
+class PopularGames(BaseModel):
+    success: bool
+    games: list[PopularGame]
+
+
+class GameData(BaseModel):
+    success: bool
+    game: Optional[GameDetails]
+
+
+class RowErrors(BaseModel):
+    row: int
+    errors: list[str]
+
+
+class BulkImport(BaseModel):
+    success: bool
+    inserted: int
+    failed: int
+    errors: list[RowErrors]
+
+
+# a game in the user's favourites
+class FavouriteGame(BaseModel):
+    favourite_id: int
+    game_id: int
+    game_title: str
+    release_year: int
+    image_url: Optional[str] = None
+    genre_id: int
+    genre_name: str
+    platform_id: int
+    platform_name: str
+    publisher_id: int
+    publisher_name: str
+    developer_id: int
+    developer_name: str
+
+
+class FavouriteGames(BaseModel):
+    success: bool
+    games: list[FavouriteGame]
+
+
+class FavouriteId(BaseModel):
+    favourite_id: int
+
+
+# the user's favourite entry for a game, an empty list if it is not a favourite
+class FavouriteCheck(BaseModel):
+    success: bool
+    fave: list[FavouriteId]
+
+
+# how many of a game's ratings gave it a score
+class ScoreCount(BaseModel):
+    score: int
+    count: int
+
+
+class RatingSummary(BaseModel):
+    game_id: int
+    rating_count: int
+    average_rating: Optional[float] = None
+    # every score, lowest first
+    histogram: list[ScoreCount]
+
+
+# a game's ratings summed up, None when the game does not exist
+class RatingSummaryData(BaseModel):
+    success: bool
+    rating: Optional[RatingSummary]
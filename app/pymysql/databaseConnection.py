@@ -1,13 +1,62 @@
 import pymysql.cursors
 from dotenv import load_dotenv
 import os
+import random
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
 
+from app.utils.metrics import Counter, InstrumentedCursor, registry
 
 load_dotenv()
 
 
-# connect to the database
-def get_db_connection():
+# pool settings. all of these can be overridden in the .env file
+POOL_MIN_SIZE = int(os.getenv("MYSQL_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("MYSQL_POOL_MAX_SIZE", "10"))
+# how long a request waits for a free connection before giving up (seconds)
+POOL_TIMEOUT = float(os.getenv("MYSQL_POOL_TIMEOUT", "10"))
+# connections older than this are closed and replaced (seconds)
+POOL_RECYCLE = float(os.getenv("MYSQL_POOL_RECYCLE", "1800"))
+# connections left unused for this long are closed, down to the min size (seconds)
+POOL_IDLE_TIMEOUT = float(os.getenv("MYSQL_POOL_IDLE_TIMEOUT", "300"))
+
+MYSQL_PORT = int(os.getenv("MYSQL_PORT", "27369"))
+
+# read replicas as a comma separated list of host[:port[:weight]], e.g.
+# MYSQL_REPLICA_HOSTS=replica1:3306:2,replica2. a replica with weight 2 gets
+# twice the reads of one with weight 1. leave unset to use the primary only
+MYSQL_REPLICA_HOSTS = os.getenv("MYSQL_REPLICA_HOSTS", "")
+# replicas further behind the primary than this are not read from (seconds).
+# it is also how long reads stay on the primary after a write
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "2"))
+# how often each replica's health and lag are checked (seconds)
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+
+PRIMARY = "primary"
+REPLICA = "replica"
+# where get_db_connection sends the current request. ReadRoutingMiddleware
+# sets it for reads, everything else (writes, startup, jobs) uses the primary
+db_route = ContextVar("db_route", default=PRIMARY)
+
+# connections handed out, by the server they went to
+db_checkouts = registry.register(
+    Counter(
+        "retrogame_db_checkouts_total",
+        "Database connections handed out, by server",
+        ("server",),
+    )
+)
+
+
+class PoolTimeoutError(pymysql.err.OperationalError):
+    pass
+
+
+# open a brand new connection to the database, the primary unless a replica
+# host is given
+def create_db_connection(host=None, port=None):
     # localhost mysql connection testing
     # connection = pymysql.connect(
     #     host=os.getenv("MYSQL_HOST"),
@@ -20,7 +69,7 @@ def get_db_connection():
     # aiven connection
     timeout = 10
     connection = pymysql.connect(
-        host=os.getenv("MYSQL_HOST"),
+        host=host or os.getenv("MYSQL_HOST"),
         user=os.getenv("MYSQL_USER"),
         password=os.getenv("MYSQL_PASSWORD"),
         database=os.getenv("MYSQL_DATABASE"),
@@ -28,7 +77,348 @@ def get_db_connection():
         charset="utf8mb4",
         connect_timeout=timeout,
         read_timeout=timeout,
-        port=27369,
+        port=port or MYSQL_PORT,
         write_timeout=timeout,
     )
     return connection
+
+
+# a connection handed out by the pool. it behaves like a normal pymysql
+# connection, except close() gives it back to the pool instead of closing it
+class PooledConnection:
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._checked_out = False
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    # cursors are wrapped so every query shows up in /metrics
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._connection.cursor(*args, **kwargs))
+
+    def close(self):
+        # calling close twice must not return the connection to the pool twice
+        if self._checked_out:
+            self._checked_out = False
+            self._pool.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect=create_db_connection,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        timeout=POOL_TIMEOUT,
+        recycle=POOL_RECYCLE,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(
+                "pool sizes must satisfy 0 <= min_size <= max_size, 1 <= max_size"
+            )
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.idle_timeout = idle_timeout
+        # idle connections, most recently used on the right
+        self._idle = deque()
+        # number of open connections, idle or checked out
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    # open connections until the pool holds min_size of them
+    def fill(self):
+        while True:
+            with self._condition:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                connection = PooledConnection(self, self._connect())
+            except Exception:
+                self._discard()
+                raise
+            with self._condition:
+                self._idle.append(connection)
+                self._condition.notify()
+
+    # hand out a healthy connection, waiting up to timeout for one to free up
+    def get_connection(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection = None
+            with self._condition:
+                if self._closed:
+                    raise pymysql.err.InterfaceError("connection pool is closed")
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            "timed out waiting for a database connection"
+                        )
+                    self._condition.wait(remaining)
+                if self._idle:
+                    # reuse the most recently used connection so the rest can go idle
+                    connection = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if connection is None:
+                try:
+                    connection = PooledConnection(self, self._connect())
+                except Exception:
+                    self._discard()
+                    raise
+            elif not self._is_usable(connection):
+                self._close_connection(connection)
+                continue
+
+            connection._checked_out = True
+            return connection
+
+    # give a connection back to the pool
+    def release(self, connection):
+        try:
+            # end any transaction left open so the next user does not read
+            # from an old snapshot or inherit uncommitted changes
+            connection.rollback()
+        except Exception:
+            self._close_connection(connection)
+            return
+
+        now = time.monotonic()
+        connection.last_used = now
+        with self._condition:
+            if not self._closed and now - connection.created_at < self.recycle:
+                self._idle.append(connection)
+                self._condition.notify()
+                return
+        self._close_connection(connection)
+
+    # close every idle connection and refuse new checkouts
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._condition.notify_all()
+        for connection in idle:
+            self._close_connection(connection)
+
+    def _is_usable(self, connection):
+        now = time.monotonic()
+        if now - connection.created_at >= self.recycle:
+            return False
+        if now - connection.last_used >= self.idle_timeout:
+            with self._condition:
+                # keep min_size connections around even if they have gone quiet
+                if self._size > self.min_size:
+                    return False
+        try:
+            # health check, do not silently reconnect inside the pool
+            connection.ping(reconnect=False)
+        except Exception:
+            return False
+        return True
+
+    def _close_connection(self, connection):
+        try:
+            connection._connection.close()
+        except Exception:
+            pass
+        self._discard()
+
+    def _discard(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+
+# a read replica with its own connection pool. it starts out unhealthy and
+# takes reads once a health check has seen it running within the lag limit
+class Replica:
+    def __init__(self, host, port=None, weight=1, connect=create_db_connection):
+        self.host = host
+        self.port = port or MYSQL_PORT
+        self.weight = weight
+        self.name = f"{host}:{self.port}"
+        self.pool = ConnectionPool(connect=lambda: connect(self.host, self.port))
+        self.healthy = False
+        # seconds behind the primary at the last check, None if unknown
+        self.lag = None
+
+    # ping the replica and read its replication lag
+    def check(self, max_lag=REPLICA_MAX_LAG):
+        try:
+            connection = self.pool.get_connection()
+            try:
+                self.lag = replication_lag(connection)
+            finally:
+                connection.close()
+        except Exception as e:
+            print(f"replica {self.name} failed its health check: {e}")
+            self.lag = None
+        self.healthy = self.lag is not None and self.lag <= max_lag
+
+    def mark_down(self):
+        self.healthy = False
+
+
+# seconds a replica is behind its source. None when replication is broken.
+# a server that is not replicating at all counts as up to date, so a second
+# standalone mysql can stand in for a replica locally
+def replication_lag(connection):
+    cursor = connection.cursor()
+    try:
+        try:
+            cursor.execute("SHOW REPLICA STATUS")
+            column = "Seconds_Behind_Source"
+        except pymysql.err.ProgrammingError:
+            # mysql before 8.0.22
+            cursor.execute("SHOW SLAVE STATUS")
+            column = "Seconds_Behind_Master"
+        status = cursor.fetchone()
+    finally:
+        cursor.close()
+    if status is None:
+        return 0
+    return status[column]
+
+
+# the configured replicas, plus a background thread keeping their health up
+# to date so picking one for a read never waits on a check
+class ReplicaSet:
+    def __init__(
+        self, replicas, max_lag=REPLICA_MAX_LAG, check_interval=REPLICA_CHECK_INTERVAL
+    ):
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="replica-health", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self.check()
+            if self._stopped.wait(self.check_interval):
+                return
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check(self.max_lag)
+
+    # a healthy replica picked at random by weight, or None if none are healthy
+    def select(self):
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return random.choices(healthy, [replica.weight for replica in healthy])[0]
+
+    def close(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        for replica in self.replicas:
+            replica.pool.close()
+
+
+# parse MYSQL_REPLICA_HOSTS into replicas
+def parse_replica_hosts(hosts):
+    replicas = []
+    for entry in hosts.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        host, port, weight = (entry.split(":") + [None, None])[:3]
+        replicas.append(
+            Replica(host, int(port) if port else None, int(weight) if weight else 1)
+        )
+    return replicas
+
+
+_pool = None
+_replicas = None
+_pool_lock = threading.Lock()
+
+
+# the pool is created on first use so importing this module stays cheap
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool()
+                pool.fill()
+                _pool = pool
+    return _pool
+
+
+# the replica set, or None when no replicas are configured
+def get_replicas():
+    global _replicas
+    if _replicas is None and MYSQL_REPLICA_HOSTS:
+        with _pool_lock:
+            if _replicas is None:
+                replicas = ReplicaSet(parse_replica_hosts(MYSQL_REPLICA_HOSTS))
+                replicas.start()
+                _replicas = replicas
+    return _replicas
+
+
+# close the pools, used on app shutdown
+def close_pool():
+    global _pool, _replicas
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        if _replicas is not None:
+            _replicas.close()
+            _replicas = None
+
+
+# send the rest of the current request's queries to the primary
+def use_primary():
+    db_route.set(PRIMARY)
+
+
+# connect to the database. connections come from the pool, and calling
+# close() on them returns them to the pool. reads routed to a replica fall
+# back to the primary when no replica is healthy or the replica fails
+def get_db_connection():
+    if db_route.get() == REPLICA:
+        replicas = get_replicas()
+        replica = replicas.select() if replicas is not None else None
+        if replica is not None:
+            try:
+                connection = replica.pool.get_connection()
+                db_checkouts.inc(replica.name)
+                return connection
+            except PoolTimeoutError:
+                pass
+            except Exception as e:
+                print(f"replica {replica.name} is down: {e}")
+                replica.mark_down()
+    connection = get_pool().get_connection()
+    db_checkouts.inc(PRIMARY)
+    return connection
@@ -0,0 +1,119 @@
+import argparse
+import sys
+
+from app.pymysql.databaseConnection import create_db_connection
+
+# run from the project root with:
+#   python -m app.pymysql.favouriteCounts --check      compare game.favourite_count
+#                                                      with the favourites table
+#   python -m app.pymysql.favouriteCounts --reconcile  correct the counts that
+#                                                      differ
+
+# game.favourite_count holds how many users have favourited each game, so
+# /games/popular never has to count the favourites table. the favourites
+# routes change it in the same transaction as the favourite they add or
+# delete. anything that writes to favourites another way (a script, a manual
+# fix, a failed deploy) leaves it out of step, which the reconciliation
+# corrects
+
+# games reconciled per transaction
+RECONCILE_BATCH_SIZE = 1000
+
+
+# add change to a game's favourite count. call it before committing the
+# write to favourites, so both change together
+def add_to_favourite_count(cursor, game_id: int, change: int):
+    cursor.execute(
+        "UPDATE game SET favourite_count = favourite_count + %s WHERE game_id = %s",
+        (change, game_id),
+    )
+
+
+# compare every game's favourite count with its favourites, a batch of games
+# at a time, and when fix is set write the correct count. each batch locks its
+# game rows first, so a favourite added or deleted while it runs is counted
+# once. returns [(game_id, stored count, actual count)] for the games that
+# differed
+def reconcile_favourite_counts(connection, fix=True):
+    cursor = connection.cursor()
+    drifted = []
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                "SELECT game_id, favourite_count FROM game WHERE game_id > %s ORDER BY game_id LIMIT %s"
+                + (" FOR UPDATE" if fix else ""),
+                (last_id, RECONCILE_BATCH_SIZE),
+            )
+            stored = {row["game_id"]: row["favourite_count"] for row in cursor.fetchall()}
+            if not stored:
+                break
+            batch_end = max(stored)
+            cursor.execute(
+                "SELECT game_id, COUNT(*) AS favourites FROM favourites WHERE game_id > %s AND game_id <= %s GROUP BY game_id",
+                (last_id, batch_end),
+            )
+            actual = {row["game_id"]: row["favourites"] for row in cursor.fetchall()}
+            batch = [
+                (game_id, count, actual.get(game_id, 0))
+                for game_id, count in stored.items()
+                if count != actual.get(game_id, 0)
+            ]
+            if fix and batch:
+                cursor.executemany(
+                    "UPDATE game SET favourite_count = %s WHERE game_id = %s",
+                    [(count, game_id) for game_id, _, count in batch],
+                )
+            connection.commit()
+            drifted.extend(batch)
+            last_id = batch_end
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return drifted
+
+
+def print_drift(drifted):
+    for game_id, stored, actual in drifted[:20]:
+        print(f"game {game_id}: favourite_count {stored}, favourites {actual}")
+    if len(drifted) > 20:
+        print(f"and {len(drifted) - 20} more")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="RetroGame DB game favourite counts"
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "--check",
+        action="store_true",
+        help="report games whose count does not match their favourites, exit 1 if any",
+    )
+    group.add_argument(
+        "--reconcile",
+        action="store_true",
+        help="recount every game's favourites and correct the counts that differ",
+    )
+    args = parser.parse_args(argv)
+
+    connection = create_db_connection()
+    try:
+        drifted = reconcile_favourite_counts(connection, fix=args.reconcile)
+        print_drift(drifted)
+        if args.reconcile:
+            print(f"corrected {len(drifted)} favourite counts")
+            return 0
+        if drifted:
+            print("run with --reconcile to fix them")
+            return 1
+        print("favourite counts are consistent")
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
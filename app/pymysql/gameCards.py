@@ -0,0 +1,206 @@
+import argparse
+import sys
+
+from app.pymysql.databaseConnection import create_db_connection
+
+# run from the project root with:
+#   python -m app.pymysql.gameCards --check    compare game_card with the tables
+#                                              it is built from
+#   python -m app.pymysql.gameCards --rebuild  rebuild game_card from scratch
+
+# game_card holds every game with the names of its genre, platform, publisher
+# and developer already joined in, plus its rating count and sum, so the read
+# endpoints get a game from one row instead of a five way join. the write
+# handlers keep it up to date in the same transaction as the write that
+# changes it
+
+# the lookup tables whose names are copied into game_card
+LOOKUP_TABLES = ("genre", "platform", "publisher", "developer")
+
+# each game_card column and where its value comes from
+CARD_COLUMNS = (
+    ("game_id", "g.game_id"),
+    ("title", "g.title"),
+    ("description", "g.description"),
+    ("release_year", "g.release_year"),
+    ("genre_id", "g.genre_id"),
+    ("genre_name", "gen.name"),
+    ("platform_id", "g.platform_id"),
+    ("platform_name", "plat.name"),
+    ("publisher_id", "g.publisher_id"),
+    ("publisher_name", "pub.name"),
+    ("developer_id", "g.developer_id"),
+    ("developer_name", "d.name"),
+    ("image_url", "g.image_url"),
+    ("rating_count", "g.rating_count"),
+    ("rating_sum", "g.rating_sum"),
+)
+
+game_card_columns = ", ".join(column for column, _ in CARD_COLUMNS)
+
+# the game_card rows as built from the source tables. add a WHERE clause to use it
+select_game_card_source = f"""
+    SELECT {", ".join(f"{source} AS {column}" for column, source in CARD_COLUMNS)}
+    FROM game g
+    JOIN genre gen ON g.genre_id = gen.genre_id
+    JOIN platform plat ON g.platform_id = plat.platform_id
+    JOIN publisher pub ON g.publisher_id = pub.publisher_id
+    JOIN developer d ON g.developer_id = d.developer_id
+    """
+
+insert_game_cards = f"INSERT INTO game_card ({game_card_columns})"
+
+# games compared per query by the consistency check
+CHECK_BATCH_SIZE = 1000
+
+
+# write a game's card from its current row. call it before committing the
+# write to the game, so both change together
+def refresh_game_card(cursor, game_id: int):
+    cursor.execute("DELETE FROM game_card WHERE game_id = %s", (game_id,))
+    cursor.execute(
+        insert_game_cards + select_game_card_source + "WHERE g.game_id = %s",
+        (game_id,),
+    )
+
+
+def delete_game_card(cursor, game_id: int):
+    cursor.execute("DELETE FROM game_card WHERE game_id = %s", (game_id,))
+
+
+# add cards for games newer than after_game_id that do not have one yet,
+# used after a bulk insert
+def add_missing_game_cards(cursor, after_game_id: int):
+    cursor.execute(
+        f"INSERT IGNORE INTO game_card ({game_card_columns})"
+        + select_game_card_source
+        + "WHERE g.game_id > %s",
+        (after_game_id,),
+    )
+
+
+# apply a change in a game's rating count and sum to its card, in the same
+# transaction as the change to game
+def add_to_card_ratings(cursor, game_id: int, count: int, total: int):
+    cursor.execute(
+        "UPDATE game_card SET rating_count = rating_count + %s, rating_sum = rating_sum + %s WHERE game_id = %s",
+        (count, total, game_id),
+    )
+
+
+# cards keep the sum of a game's ratings, the api shows the average instead
+def with_average_rating(card):
+    total = card.pop("rating_sum")
+    count = card["rating_count"]
+    card["average_rating"] = round(total / count, 2) if count else None
+    return card
+
+
+# copy a renamed genre, platform, publisher or developer into the cards
+def rename_in_game_cards(cursor, table: str, id: int, name: str):
+    if table not in LOOKUP_TABLES:
+        raise ValueError(f"game_card does not copy names from {table}")
+    cursor.execute(
+        f"UPDATE game_card SET {table}_name = %s WHERE {table}_id = %s", (name, id)
+    )
+
+
+# replace every card in one transaction, so readers never see it half built.
+# returns the number of cards written
+def rebuild_game_cards(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM game_card")
+        cursor.execute(insert_game_cards + select_game_card_source)
+        count = cursor.rowcount
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+    return count
+
+
+# compare every card with the row it would be built from now, a batch of
+# games at a time. returns the game ids with no card, the cards with no game
+# and the cards whose values differ
+def check_game_cards(connection):
+    cursor = connection.cursor()
+    missing, orphaned, stale = [], [], []
+    last_id = 0
+    try:
+        while True:
+            cursor.execute(
+                select_game_card_source
+                + "WHERE g.game_id > %s ORDER BY g.game_id LIMIT %s",
+                (last_id, CHECK_BATCH_SIZE),
+            )
+            expected = {row["game_id"]: row for row in cursor.fetchall()}
+            if not expected:
+                break
+            batch_end = max(expected)
+            cursor.execute(
+                f"SELECT {game_card_columns} FROM game_card WHERE game_id > %s AND game_id <= %s",
+                (last_id, batch_end),
+            )
+            cards = {row["game_id"]: row for row in cursor.fetchall()}
+            for game_id, row in expected.items():
+                card = cards.pop(game_id, None)
+                if card is None:
+                    missing.append(game_id)
+                elif card != row:
+                    stale.append(game_id)
+            orphaned.extend(cards)
+            last_id = batch_end
+        # cards past the newest game
+        cursor.execute("SELECT game_id FROM game_card WHERE game_id > %s", (last_id,))
+        orphaned.extend(row["game_id"] for row in cursor.fetchall())
+    finally:
+        cursor.close()
+    return sorted(missing), sorted(orphaned), sorted(stale)
+
+
+def print_check(missing, orphaned, stale):
+    for label, game_ids in (
+        ("games without a card", missing),
+        ("cards without a game", orphaned),
+        ("cards out of date", stale),
+    ):
+        shown = ", ".join(str(game_id) for game_id in game_ids[:20])
+        more = f" and {len(game_ids) - 20} more" if len(game_ids) > 20 else ""
+        print(f"{len(game_ids):>6}  {label}" + (f": {shown}{more}" if shown else ""))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RetroGame DB game_card read model")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "--check",
+        action="store_true",
+        help="report cards that do not match their game, exit 1 if any",
+    )
+    group.add_argument(
+        "--rebuild", action="store_true", help="rebuild every card from the game table"
+    )
+    args = parser.parse_args(argv)
+
+    connection = create_db_connection()
+    try:
+        if args.rebuild:
+            count = rebuild_game_cards(connection)
+            print(f"rebuilt {count} game cards")
+            return 0
+        missing, orphaned, stale = check_game_cards(connection)
+        print_check(missing, orphaned, stale)
+        if missing or orphaned or stale:
+            print("run with --rebuild to fix them")
+            return 1
+        print("game_card is consistent")
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import argparse
+import sys
+from datetime import datetime
+
+import pymysql
+
+from app.pymysql.databaseConnection import create_db_connection
+from app.pymysql.migrations import MIGRATIONS
+
+# run from the project root with:
+#   python -m app.pymysql.migrate            apply pending migrations
+#   python -m app.pymysql.migrate --status   list applied and pending migrations
+#   python -m app.pymysql.migrate --check    explain the hot queries and make
+#                                            sure they use an index
+
+
+# the queries the routers run most, with sample parameters, and the indexes
+# each of them is expected to use on its main table. the foreign key columns
+# get an index of their own named after the column, which is also fine
+HOT_QUERIES = [
+    (
+        "games page",
+        "SELECT game_id, title FROM game WHERE game_id > %s ORDER BY game_id LIMIT %s",
+        (0, 51),
+        "game",
+        {"PRIMARY"},
+    ),
+    (
+        "single game",
+        "SELECT * FROM game_card WHERE game_id = %s",
+        (1,),
+        "game_card",
+        {"PRIMARY"},
+    ),
+    (
+        "platform games",
+        "SELECT game_id FROM game_card WHERE platform_id = %s AND game_id > %s ORDER BY game_id LIMIT %s",
+        (1, 0, 51),
+        "game_card",
+        {"idx_game_card_platform_game"},
+    ),
+    (
+        "genre games",
+        "SELECT game_id FROM game_card WHERE genre_id = %s AND game_id > %s ORDER BY game_id LIMIT %s",
+        (1, 0, 51),
+        "game_card",
+        {"idx_game_card_genre_game"},
+    ),
+    (
+        "publisher games",
+        "SELECT game_id FROM game_card WHERE publisher_id = %s AND game_id > %s ORDER BY game_id LIMIT %s",
+        (1, 0, 51),
+        "game_card",
+        {"idx_game_card_publisher_game"},
+    ),
+    (
+        "developer games",
+        "SELECT game_id FROM game_card WHERE developer_id = %s AND game_id > %s ORDER BY game_id LIMIT %s",
+        (1, 0, 51),
+        "game_card",
+        {"idx_game_card_developer_game"},
+    ),
+    (
+        "games by release year",
+        "SELECT game_id FROM game WHERE release_year BETWEEN %s AND %s",
+        (1985, 1989),
+        "game",
+        {"idx_game_release_year"},
+    ),
+    (
+        "game search",
+        "SELECT game_id FROM game WHERE MATCH(title, description) AGAINST (%s IN NATURAL LANGUAGE MODE)",
+        ("adventure",),
+        "game",
+        {"ft_game_title_description"},
+    ),
+    (
+        "user favourites",
+        "SELECT f.favourite_id, f.game_id FROM favourites f WHERE f.user_id = %s",
+        (1,),
+        "f",
+        {"uq_favourites_user_game"},
+    ),
+    (
+        "favourite check",
+        "SELECT favourite_id FROM favourites WHERE user_id = %s AND game_id = %s",
+        (1, 1),
+        "favourites",
+        {"uq_favourites_user_game"},
+    ),
+    (
+        "user rating",
+        "SELECT rating_id, score FROM ratings WHERE user_id = %s AND game_id = %s",
+        (1, 1),
+        "ratings",
+        {"uq_ratings_user_game"},
+    ),
+    (
+        "user by email",
+        "SELECT * FROM users WHERE email = %s",
+        ("someone@example.com",),
+        "users",
+        {"email"},
+    ),
+]
+
+
+def ensure_migrations_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations(
+            version INT PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL
+        );""")
+
+
+def get_applied_versions(cursor):
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row["version"] for row in cursor.fetchall()}
+
+
+# apply every migration that has not been recorded yet, oldest first
+def run_migrations(connection):
+    cursor = connection.cursor()
+    ensure_migrations_table(cursor)
+    applied = get_applied_versions(cursor)
+    ran = []
+    for version, name, statements in sorted(MIGRATIONS):
+        if version in applied:
+            continue
+        print(f"applying migration {version}: {name}")
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                (version, name, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            connection.commit()
+        except pymysql.Error:
+            connection.rollback()
+            print(f"migration {version} failed, later migrations were not run")
+            raise
+        ran.append(version)
+    cursor.close()
+    return ran
+
+
+def print_status(connection):
+    cursor = connection.cursor()
+    ensure_migrations_table(cursor)
+    applied = get_applied_versions(cursor)
+    cursor.close()
+    for version, name, _ in sorted(MIGRATIONS):
+        state = "applied" if version in applied else "pending"
+        print(f"{version:>4}  {state:<8} {name}")
+
+
+# explain each hot query and return the ones that do not use an expected index
+def check_indexes(connection):
+    cursor = connection.cursor()
+    problems = []
+    for name, query, params, table, expected in HOT_QUERIES:
+        cursor.execute("EXPLAIN " + query, params)
+        plan = [row for row in cursor.fetchall() if row["table"] == table]
+        key = plan[0]["key"] if plan else None
+        if key in expected:
+            print(f"ok      {name}: {table} uses {key}")
+        else:
+            print(
+                f"MISSING {name}: {table} uses {key}, expected one of {sorted(expected)}"
+            )
+            problems.append(name)
+    cursor.close()
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RetroGame DB schema migrations")
+    parser.add_argument(
+        "--status", action="store_true", help="list migrations and exit"
+    )
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="after migrating, check the hot queries use their indexes",
+    )
+    args = parser.parse_args(argv)
+
+    connection = create_db_connection()
+    try:
+        if args.status:
+            print_status(connection)
+            return 0
+        ran = run_migrations(connection)
+        if not ran:
+            print("database is up to date")
+        if args.check and check_indexes(connection):
+            # an optimizer may skip an index on a nearly empty table, so run
+            # the check against a database with realistic data
+            return 1
+    finally:
+        connection.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# schema migrations, applied in order by app/pymysql/migrate.py. each entry is
+# (version, name, statements). never edit a migration that has shipped, add a
+# new one instead. mysql commits ddl straight away, so keep each migration to
+# statements that are safe to run as a unit (one ALTER TABLE per table)
+
+MIGRATIONS = [
+    (
+        1,
+        "create tables",
+        [
+            """
+            CREATE TABLE IF NOT EXISTS platform(
+                platform_id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL UNIQUE,
+                logo_url VARCHAR(255)
+            );""",
+            """
+            CREATE TABLE IF NOT EXISTS publisher(
+                publisher_id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL UNIQUE
+            );""",
+            """
+            CREATE TABLE IF NOT EXISTS developer(
+                developer_id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL UNIQUE
+            );""",
+            """
+            CREATE TABLE IF NOT EXISTS genre(
+                genre_id INT AUTO_INCREMENT PRIMARY KEY,
+                name VARCHAR(100) NOT NULL UNIQUE
+            );""",
+            """
+            CREATE TABLE IF NOT EXISTS game(
+                game_id INT AUTO_INCREMENT PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                description TEXT NOT NULL,
+                release_year INT NOT NULL,
+                genre_id INT NOT NULL,
+                platform_id INT NOT NULL,
+                publisher_id INT NOT NULL,
+                developer_id INT NOT NULL,
+                image_url VARCHAR(255),
+                FOREIGN KEY (genre_id) REFERENCES genre(genre_id),
+                FOREIGN KEY (platform_id) REFERENCES platform(platform_id),
+                FOREIGN KEY (publisher_id) REFERENCES publisher(publisher_id),
+                FOREIGN KEY (developer_id) REFERENCES developer(developer_id)
+            );""",
+            """
+            CREATE TABLE IF NOT EXISTS users(
+                user_id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(50) NOT NULL UNIQUE,
+                email VARCHAR(100) NOT NULL UNIQUE,
+                password VARCHAR(255) NOT NULL,
+                role VARCHAR(6) CHECK (role IN ('admin', 'editor', 'user')) NOT NULL DEFAULT 'user',
+                join_date DATETIME NOT NULL
+            );""",
+            """
+            CREATE TABLE IF NOT EXISTS ratings(
+                rating_id INT AUTO_INCREMENT PRIMARY KEY,
+                game_id INT NOT NULL,
+                user_id INT NOT NULL,
+                score INT,
+                timestamp DATETIME NOT NULL,
+                FOREIGN KEY (game_id) REFERENCES game(game_id),
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            );""",
+            """
+            CREATE TABLE IF NOT EXISTS favourites(
+                favourite_id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                game_id INT NOT NULL,
+                timestamp DATETIME NOT NULL,
+                FOREIGN KEY (game_id) REFERENCES game(game_id),
+                FOREIGN KEY (user_id) REFERENCES users(user_id)
+            );""",
+        ],
+    ),
+    (
+        2,
+        "performance indexes",
+        [
+            # the unique index below would fail on duplicate favourites, so
+            # keep the oldest entry of any duplicates first
+            """
+            DELETE newer FROM favourites newer
+            JOIN favourites older
+                ON newer.user_id = older.user_id
+                AND newer.game_id = older.game_id
+                AND newer.favourite_id > older.favourite_id;""",
+            # one favourite per user and game, also serves the per user listing
+            """
+            ALTER TABLE favourites
+                ADD UNIQUE INDEX uq_favourites_user_game (user_id, game_id);""",
+            # back the per entity listings, which seek on game_id inside one
+            # foreign key value, and the release year filters
+            """
+            ALTER TABLE game
+                ADD INDEX idx_game_platform_game (platform_id, game_id),
+                ADD INDEX idx_game_genre_game (genre_id, game_id),
+                ADD INDEX idx_game_publisher_game (publisher_id, game_id),
+                ADD INDEX idx_game_developer_game (developer_id, game_id),
+                ADD INDEX idx_game_release_year (release_year);""",
+        ],
+    ),
+    (
+        3,
+        "game search index",
+        [
+            # backs /games/search. without it the api searches an in-process index
+            """
+            ALTER TABLE game
+                ADD FULLTEXT INDEX ft_game_title_description (title, description);""",
+        ],
+    ),
+    (
+        4,
+        "game card read model",
+        [
+            # each game with its lookup names joined in, kept up to date by
+            # the write handlers. see app/pymysql/gameCards.py
+            """
+            CREATE TABLE IF NOT EXISTS game_card(
+                game_id INT PRIMARY KEY,
+                title VARCHAR(255) NOT NULL,
+                description TEXT NOT NULL,
+                release_year INT NOT NULL,
+                genre_id INT NOT NULL,
+                genre_name VARCHAR(100) NOT NULL,
+                platform_id INT NOT NULL,
+                platform_name VARCHAR(100) NOT NULL,
+                publisher_id INT NOT NULL,
+                publisher_name VARCHAR(100) NOT NULL,
+                developer_id INT NOT NULL,
+                developer_name VARCHAR(100) NOT NULL,
+                image_url VARCHAR(255),
+                INDEX idx_game_card_platform_game (platform_id, game_id),
+                INDEX idx_game_card_genre_game (genre_id, game_id),
+                INDEX idx_game_card_publisher_game (publisher_id, game_id),
+                INDEX idx_game_card_developer_game (developer_id, game_id)
+            );""",
+            """
+            INSERT INTO game_card (game_id, title, description, release_year, genre_id, genre_name, platform_id, platform_name, publisher_id, publisher_name, developer_id, developer_name, image_url)
+            SELECT g.game_id, g.title, g.description, g.release_year, g.genre_id, gen.name, g.platform_id, plat.name, g.publisher_id, pub.name, g.developer_id, d.name, g.image_url
+            FROM game g
+            JOIN genre gen ON g.genre_id = gen.genre_id
+            JOIN platform plat ON g.platform_id = plat.platform_id
+            JOIN publisher pub ON g.publisher_id = pub.publisher_id
+            JOIN developer d ON g.developer_id = d.developer_id;""",
+        ],
+    ),
+    (
+        5,
+        "game rating aggregates",
+        [
+            # scores run from 1 to 5. nothing wrote to ratings before this, so
+            # drop any rows that do not fit, and keep the newest rating when a
+            # user rated a game more than once
+            """
+            DELETE FROM ratings WHERE score IS NULL OR score NOT BETWEEN 1 AND 5;""",
+            """
+            DELETE older FROM ratings older
+            JOIN ratings newer
+                ON older.user_id = newer.user_id
+                AND older.game_id = newer.game_id
+                AND older.rating_id < newer.rating_id;""",
+            """
+            ALTER TABLE ratings
+                MODIFY score TINYINT NOT NULL,
+                ADD CONSTRAINT chk_ratings_score CHECK (score BETWEEN 1 AND 5),
+                ADD UNIQUE INDEX uq_ratings_user_game (user_id, game_id);""",
+            # each game's ratings summed up, kept up to date by the ratings
+            # routes in the same transaction as the rating they change
+            """
+            ALTER TABLE game
+                ADD COLUMN rating_count INT NOT NULL DEFAULT 0,
+                ADD COLUMN rating_sum INT NOT NULL DEFAULT 0,
+                ADD COLUMN rating_1 INT NOT NULL DEFAULT 0,
+                ADD COLUMN rating_2 INT NOT NULL DEFAULT 0,
+                ADD COLUMN rating_3 INT NOT NULL DEFAULT 0,
+                ADD COLUMN rating_4 INT NOT NULL DEFAULT 0,
+                ADD COLUMN rating_5 INT NOT NULL DEFAULT 0;""",
+            """
+            ALTER TABLE game_card
+                ADD COLUMN rating_count INT NOT NULL DEFAULT 0,
+                ADD COLUMN rating_sum INT NOT NULL DEFAULT 0;""",
+            """
+            UPDATE game g
+            JOIN (
+                SELECT game_id, COUNT(*) AS ratings, SUM(score) AS total,
+                    SUM(score = 1) AS ones, SUM(score = 2) AS twos, SUM(score = 3) AS threes,
+                    SUM(score = 4) AS fours, SUM(score = 5) AS fives
+                FROM ratings
+                GROUP BY game_id
+            ) r ON g.game_id = r.game_id
+            SET g.rating_count = r.ratings, g.rating_sum = r.total,
+                g.rating_1 = r.ones, g.rating_2 = r.twos, g.rating_3 = r.threes,
+                g.rating_4 = r.fours, g.rating_5 = r.fives;""",
+            """
+            UPDATE game_card c
+            JOIN game g ON c.game_id = g.game_id
+            SET c.rating_count = g.rating_count, c.rating_sum = g.rating_sum;""",
+        ],
+    ),
+    (
+        6,
+        "game favourite counts",
+        [
+            # how many users have favourited each game, kept up to date by the
+            # favourites routes in the same transaction as the favourite they
+            # add or delete. see app/pymysql/favouriteCounts.py
+            """
+            ALTER TABLE game
+                ADD COLUMN favourite_count INT NOT NULL DEFAULT 0;""",
+            """
+            UPDATE game g
+            JOIN (
+                SELECT game_id, COUNT(*) AS favourites
+                FROM favourites
+                GROUP BY game_id
+            ) f ON g.game_id = f.game_id
+            SET g.favourite_count = f.favourites;""",
+        ],
+    ),
+]
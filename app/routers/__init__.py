@@ -0,0 +1,32 @@
+import importlib
+
+# the router modules, in the order their routes are registered
+ROUTERS = (
+    "users",
+    "platform",
+    "genre",
+    "developer",
+    "publisher",
+    "game",
+    "favourites",
+    "ratings",
+    "token",
+)
+
+# the first path segment of every route -> the router module serving it
+ROUTER_FOR_SEGMENT = {
+    "users": "users",
+    "game": "game",
+    "games": "game",
+    "favourites": "favourites",
+    "ratings": "ratings",
+    "token": "token",
+}
+for _name in ("platform", "genre", "developer", "publisher"):
+    ROUTER_FOR_SEGMENT[_name] = _name
+    ROUTER_FOR_SEGMENT[f"{_name}s"] = _name
+    ROUTER_FOR_SEGMENT[f"{_name}-data"] = _name
+
+
+def import_router(name):
+    return importlib.import_module(f"{__name__}.{name}").router
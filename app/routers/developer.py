@@ -1,10 +1,29 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Query, status, Depends
 from pydantic import BaseModel
-from app.pymysql.databaseConnection import get_db_connection
-from typing import Annotated
+from app.pymysql.databaseConnection import PoolTimeoutError, get_db_connection
+from app.pymysql.gameCards import rename_in_game_cards
+from typing import Annotated, Optional
 from app.dependencies import get_current_user
 from app.models.User import User
-from app.utils.db_utils import get_info_list, get_info_data
+from app.models.Responses import (
+    Detail,
+    DeveloperData,
+    DeveloperGames,
+    DeveloperRow,
+    Message,
+    Rows,
+)
+from app.utils.responses import detail_response
+from app.utils.db_utils import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    get_info_list,
+    get_info_data,
+    fetch_game_page,
+)
+from app.utils.cache import reference_cache
+from app.utils.catalog import CATALOG_ENGINE, catalog
+from app.utils.etag import GAME_LISTING_TABLES, bump_table_version, etag_for
 
 router = APIRouter()
 
@@ -17,27 +36,72 @@ class Developer(BaseModel):
 
 
 # get all developers
-@router.get("/developers/")
+@router.get(
+    "/developers/",
+    dependencies=[Depends(etag_for("developer"))],
+    response_model=Detail[Rows[DeveloperRow]],
+)
 def get_developers():
     query = "SELECT developer_id, name FROM developer"
-    get_info_list(query)
+    rows = get_info_list(query, cache_namespace="developer")
+    return detail_response({"success": True, "rows": rows})
 
 
 # fetch all data about a single developer
-@router.get("/developer-data/{developer_id}")
+@router.get(
+    "/developer-data/{developer_id}",
+    dependencies=[Depends(etag_for("developer"))],
+    response_model=Detail[DeveloperData],
+)
 def get_developer_data(developer_id):
     fetch_developer_data = (
         "SELECT developer_id, name FROM developer WHERE developer_id = %s"
     )
-    get_info_data(fetch_developer_data, "developer", developer_id)
+    data = get_info_data(
+        fetch_developer_data, developer_id, cache_namespace="developer"
+    )
+    return detail_response({"success": True, "developer": data})
 
 
 # get all games developed by the developer
-@router.get("/developer/{developer_id}")
-def get_developer_games(developer_id):
+@router.get(
+    "/developer/{developer_id}",
+    dependencies=[Depends(etag_for(*GAME_LISTING_TABLES))],
+    response_model=Detail[DeveloperGames],
+)
+def get_developer_games(
+    developer_id: int,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+):
+    if CATALOG_ENGINE == "memory":
+        try:
+            developer_name, games, next_cursor = catalog.listing(
+                "developer", developer_id, limit, after
+            )
+        except HTTPException as http_exception:
+            raise http_exception
+        except PoolTimeoutError:
+            # answered with a 503, see app.main
+            raise
+        except Exception as e:
+            print(e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={"success": False, "message": "An error occurred"},
+            )
+        return detail_response(
+            {
+                "success": True,
+                "games": games,
+                "developer_name": developer_name,
+                "next_cursor": next_cursor,
+            }
+        )
+
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -48,15 +112,17 @@ def get_developer_games(developer_id):
         developer_name = cursor.fetchone()["name"]
 
         fetch_games_by_developer = """
-            SELECT g.game_id, g.title AS game_title, g.image_url, g.genre_id, gen.name AS genre_name, g.platform_id, p.name AS platform_name, g.publisher_id, pub.name AS publisher_name
-            FROM game g
-            JOIN genre gen ON g.genre_id = gen.genre_id
-            JOIN platform p ON g.platform_id = p.platform_id
-            JOIN publisher pub ON g.publisher_id = pub.publisher_id
-            WHERE g.developer_id = %s;
+            SELECT game_id, title AS game_title, image_url, genre_id, genre_name, platform_id, platform_name, publisher_id, publisher_name
+            FROM game_card
+            WHERE developer_id = %s AND game_id > %s
+            ORDER BY game_id
+            LIMIT %s;
             """
-        cursor.execute(fetch_games_by_developer, (developer_id,))
-        games = cursor.fetchall()
+        games, next_cursor = fetch_game_page(
+            cursor, fetch_games_by_developer, (developer_id,), limit, after
+        )
+    except HTTPException as http_exception:
+        raise http_exception
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -66,15 +132,18 @@ def get_developer_games(developer_id):
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "games": games, "developer_name": developer_name},
+    return detail_response(
+        {
+            "success": True,
+            "games": games,
+            "developer_name": developer_name,
+            "next_cursor": next_cursor,
+        }
     )
 
 
 # add a new developer to the database
-@router.post("/developer/", response_model=User)
+@router.post("/developer/", response_model=Detail[Message])
 def post_developer(
     developer_data: Developer, current_user: Annotated[User, Depends(get_current_user)]
 ):
@@ -83,8 +152,8 @@ def post_developer(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         name = developer_data.name
 
@@ -93,6 +162,10 @@ def post_developer(
         add_developer_query = "INSERT INTO developer (name) VALUES (%s)"
         cursor.execute(add_developer_query, (name,))
         connection.commit()
+        # the cached developer lists are stale now
+        reference_cache.invalidate("developer")
+        bump_table_version("developer")
+        catalog.put_lookup("developer", cursor.lastrowid, name)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -101,15 +174,11 @@ def post_developer(
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Developer added successfully"},
-    )
+    return detail_response({"success": True, "message": "Developer added successfully"})
 
 
 # edit a video game developer
-@router.put("/developer/{developer_id}", response_model=User)
+@router.put("/developer/{developer_id}", response_model=Detail[Message])
 def put_developer(
     developer_id: int,
     developer_data: Developer,
@@ -120,8 +189,8 @@ def put_developer(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         name = developer_data.name
 
@@ -140,7 +209,12 @@ def put_developer(
             "UPDATE developer SET name = %s WHERE developer_id = %s"
         )
         cursor.execute(update_developer_query, (name, developer_id))
+        rename_in_game_cards(cursor, "developer", developer_id, name)
         connection.commit()
+        # the cached developer lists are stale now
+        reference_cache.invalidate("developer")
+        bump_table_version("developer")
+        catalog.put_lookup("developer", developer_id, name)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -150,15 +224,13 @@ def put_developer(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Developer updated successfully"},
+    return detail_response(
+        {"success": True, "message": "Developer updated successfully"}
     )
 
 
 # delete a video game developer
-@router.delete("/developer/{developer_id}", response_model=User)
+@router.delete("/developer/{developer_id}", response_model=Detail[Message])
 def delete_developer(
     developer_id: int, current_user: Annotated[User, Depends(get_current_user)]
 ):
@@ -167,8 +239,8 @@ def delete_developer(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -184,6 +256,10 @@ def delete_developer(
         delete_developer_query = "DELETE FROM developer WHERE developer_id = %s"
         cursor.execute(delete_developer_query, (developer_id,))
         connection.commit()
+        # the cached developer lists are stale now
+        reference_cache.invalidate("developer")
+        bump_table_version("developer")
+        catalog.remove_lookup("developer", developer_id)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -193,8 +269,6 @@ def delete_developer(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Developer successfully deleted"},
+    return detail_response(
+        {"success": True, "message": "Developer successfully deleted"}
     )
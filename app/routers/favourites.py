@@ -1,38 +1,43 @@
+import pymysql
 from fastapi import APIRouter, HTTPException, status, Depends
 from pydantic import BaseModel
 from typing import Annotated
 from datetime import datetime
 from app.pymysql.databaseConnection import get_db_connection
+from app.pymysql.favouriteCounts import add_to_favourite_count
 from app.dependencies import get_current_user
 from app.models.User import User
+from app.models.Responses import Detail, FavouriteCheck, FavouriteGames, Message
+from app.utils.responses import detail_response
+from app.utils.db_utils import run_db
+from app.utils.etag import bump_table_version
+from app.utils.popularity import leaderboard
 
 
 router = APIRouter()
 
+# mysql error for a duplicate key
+ER_DUP_ENTRY = 1062
+
 
 class Favourites(BaseModel):
     game_id: int
 
 
-# get all of the user's favourites
-@router.get("/favourites/", response_model=User)
-async def get_games(current_user: Annotated[User, Depends(get_current_user)]):
+# fetch the user's favourited games. runs in the database executor
+def fetch_favourite_games(user_id: int):
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
         get_faves_query = """
-        SELECT f.favourite_id, g.game_id, g.title AS game_title, g.release_year, g.image_url, gen.genre_id, gen.name AS genre_name, plat.platform_id, plat.name AS platform_name, pub.publisher_id, pub.name AS publisher_name, d.developer_id, d.name AS developer_name
+        SELECT f.favourite_id, c.game_id, c.title AS game_title, c.release_year, c.image_url, c.genre_id, c.genre_name, c.platform_id, c.platform_name, c.publisher_id, c.publisher_name, c.developer_id, c.developer_name
         FROM favourites f
-        JOIN game g ON f.game_id = g.game_id
-        JOIN genre gen ON g.genre_id = gen.genre_id
-        JOIN platform plat ON plat.platform_id = g.platform_id
-        JOIN publisher pub ON pub.publisher_id = g.publisher_id
-        JOIN developer d ON d.developer_id = g.developer_id
+        JOIN game_card c ON f.game_id = c.game_id
         WHERE f.user_id = %s;
         """
-        cursor.execute(get_faves_query, (current_user["user_id"],))
+        cursor.execute(get_faves_query, (user_id,))
         games = cursor.fetchall()
     except Exception as e:
         print(e)
@@ -42,21 +47,22 @@ async def get_games(current_user: Annotated[User, Depends(get_current_user)]):
         )
     finally:
         connection.close()
+    return games
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK, detail={"success": True, "games": games}
-    )
 
+# get all of the user's favourites
+@router.get("/favourites/", response_model=Detail[FavouriteGames])
+async def get_games(current_user: Annotated[User, Depends(get_current_user)]):
+    games = await run_db(fetch_favourite_games, current_user["user_id"])
 
-# check if the fave exists
-@router.get("/favourites/{game_id}", response_model=User)
-async def get_fave_check(
-    game_id: int, current_user: Annotated[User, Depends(get_current_user)]
-):
+    return detail_response({"success": True, "games": games})
+
+
+# look up the user's favourite entry for a game. runs in the database executor
+def fetch_favourite(user_id: int, game_id: int):
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -65,7 +71,7 @@ async def get_fave_check(
         WHERE user_id = %s AND game_id = %s;
         """
 
-        values = (current_user["user_id"], game_id)
+        values = (user_id, game_id)
 
         cursor.execute(get_fave_query, values)
         fave = cursor.fetchall()
@@ -77,24 +83,24 @@ async def get_fave_check(
         )
     finally:
         connection.close()
-
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK, detail={"success": True, "fave": fave}
-    )
+    return fave
 
 
-# add a favourite to the user's list
-@router.post("/favourites/", response_model=User)
-async def post_favourites(
-    favourites_data: Favourites,
-    current_user: Annotated[User, Depends(get_current_user)],
+# check if the fave exists
+@router.get("/favourites/{game_id}", response_model=Detail[FavouriteCheck])
+async def get_fave_check(
+    game_id: int, current_user: Annotated[User, Depends(get_current_user)]
 ):
+    fave = await run_db(fetch_favourite, current_user["user_id"], game_id)
+
+    return detail_response({"success": True, "fave": fave})
+
+
+# insert a favourite row. runs in the database executor
+def add_favourite(user_id: int, game_id: int):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
-        # gather values from the json object
-        user_id = current_user["user_id"]
-        game_id = favourites_data.game_id
+        # gather values for the new entry
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
         # tuple containing the values needed for the query
@@ -102,25 +108,27 @@ async def post_favourites(
 
         # create a cursor object
         cursor = connection.cursor()
-        check_favourite_query = (
-            "SELECT * FROM favourites WHERE game_id = %s AND user_id = %s"
-        )
-        cursor.execute(check_favourite_query, (game_id, user_id))
-        existingFave = cursor.fetchone()
-        if existingFave:
-            raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Favourite entry already exists",
-            )
-
+        # a favourite that already exists is caught by the unique index on
+        # (user_id, game_id), which also covers two requests sent at once
         add_favourite_query = (
             "INSERT INTO favourites (user_id, game_id, timestamp) VALUES (%s, %s, %s)"
         )
 
         cursor.execute(add_favourite_query, values)
+        add_to_favourite_count(cursor, game_id, 1)
         connection.commit()
-    except HTTPException as http_exception:
-        raise http_exception
+        bump_table_version("favourites")
+    except pymysql.err.IntegrityError as e:
+        if e.args[0] == ER_DUP_ENTRY:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Favourite entry already exists",
+            )
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "Failed to add favourite"},
+        )
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -129,26 +137,34 @@ async def post_favourites(
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Favourite added successfully"},
-    )
 
+    # the favourite is committed, so a failure here reloads the leaderboard
+    # instead of failing the request
+    leaderboard.add_favourites(game_id, 1)
 
-# delete a favourite
-@router.delete("/favourites/{favourite_id}", response_model=User)
-async def delete_genre(
-    favourite_id: int, current_user: Annotated[User, Depends(get_current_user)]
+
+# add a favourite to the user's list
+@router.post("/favourites/", response_model=Detail[Message])
+async def post_favourites(
+    favourites_data: Favourites,
+    current_user: Annotated[User, Depends(get_current_user)],
 ):
+    await run_db(add_favourite, current_user["user_id"], favourites_data.game_id)
+    return detail_response({"success": True, "message": "Favourite added successfully"})
+
+
+# delete a favourite row owned by the user. runs in the database executor
+def remove_favourite(favourite_id: int, user_id: int):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
-        # check if the entry exists first
+        # check if the entry exists first. locked, so two deletes of the same
+        # favourite cannot both take it off the game's count
         cursor.execute(
-            "SELECT * FROM favourites WHERE favourite_id = %s", (favourite_id,)
+            "SELECT * FROM favourites WHERE favourite_id = %s FOR UPDATE",
+            (favourite_id,),
         )
         favourite = cursor.fetchone()
 
@@ -157,14 +173,16 @@ async def delete_genre(
                 status_code=status.HTTP_404_NOT_FOUND, detail="Favourite not found"
             )
         # if the favourite does not belong to the current user, then raise a 401
-        if favourite["user_id"] != current_user["user_id"]:
+        if favourite["user_id"] != user_id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail={"message": "You are unauthorized to delete this favourite"},
             )
         delete_genre_query = "DELETE FROM favourites WHERE favourite_id = %s"
         cursor.execute(delete_genre_query, (favourite_id,))
+        add_to_favourite_count(cursor, favourite["game_id"], -1)
         connection.commit()
+        bump_table_version("favourites")
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -174,8 +192,16 @@ async def delete_genre(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Favourite successfully deleted"},
+    leaderboard.add_favourites(favourite["game_id"], -1)
+
+
+# delete a favourite
+@router.delete("/favourites/{favourite_id}", response_model=Detail[Message])
+async def delete_genre(
+    favourite_id: int, current_user: Annotated[User, Depends(get_current_user)]
+):
+    await run_db(remove_favourite, favourite_id, current_user["user_id"])
+
+    return detail_response(
+        {"success": True, "message": "Favourite successfully deleted"}
     )
@@ -1,13 +1,79 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from pydantic import BaseModel
-from typing import Annotated
-from app.pymysql.databaseConnection import get_db_connection
+import json
+
+import pymysql
+from fastapi import APIRouter, HTTPException, Query, Request, status, Depends
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from typing import Annotated, Optional
+from app.pymysql.databaseConnection import PoolTimeoutError, get_db_connection
+from app.pymysql.gameCards import (
+    add_missing_game_cards,
+    delete_game_card,
+    game_card_columns,
+    refresh_game_card,
+    with_average_rating,
+)
 from app.dependencies import get_current_user
 from app.models.User import User
-from app.utils.db_utils import get_info_list
+from app.models.Responses import (
+    BulkImport,
+    Detail,
+    GameBatch,
+    GameData,
+    GameSearch,
+    GamesPage,
+    Message,
+    PopularGames,
+)
+from app.utils.catalog import CATALOG_ENGINE, catalog
+from app.utils.popularity import leaderboard
+from app.utils.search_index import (
+    fulltext_available,
+    mark_fulltext_unavailable,
+    search_index,
+)
+from app.utils.etag import GAME_LISTING_TABLES, bump_table_version, etag_for
+from app.utils.responses import detail_response
+from app.utils.db_utils import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    fetch_game_page,
+    get_info_stream,
+    run_db,
+)
 
 router = APIRouter()
 
+# how far into the results /games/search can page
+SEARCH_MAX_OFFSET = 1000
+# mysql error raised by MATCH when there is no FULLTEXT index for the columns
+ER_FT_MATCHING_KEY_NOT_FOUND = 1191
+
+# most games that can be asked for in one /games/batch call
+BATCH_MAX_IDS = 100
+
+# games /games/popular returns by default, and the most it returns
+POPULAR_DEFAULT_LIMIT = 10
+POPULAR_MAX_LIMIT = 100
+
+# rows inserted per transaction by /games/bulk, and the most rows per request
+BULK_CHUNK_SIZE = 500
+BULK_MAX_CHUNK_SIZE = 5000
+BULK_MAX_ROWS = 50000
+
+# content types read as one json object per line by /games/bulk
+NDJSON_CONTENT_TYPES = (
+    "application/x-ndjson",
+    "application/ndjson",
+    "application/jsonl",
+)
+
+add_game_query = "INSERT INTO game (title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
+
+# a game with the names of its genre, platform, publisher and developer,
+# read from the game_card read model. add a WHERE clause to use it
+select_game_details = f"SELECT {game_card_columns} FROM game_card "
+
 
 class Game(BaseModel):
     title: str
@@ -20,59 +86,394 @@ class Game(BaseModel):
     image_url: str = None
 
 
-# get games
-@router.get("/games/")
-def get_games():
-    query = "SELECT game_id, title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url FROM game"
-    get_info_list(query)
+# the filters /games/ accepts, as (query parameter, sql condition)
+game_filters = (
+    ("genre_id", "genre_id = %s"),
+    ("platform_id", "platform_id = %s"),
+    ("publisher_id", "publisher_id = %s"),
+    ("developer_id", "developer_id = %s"),
+    ("min_year", "release_year >= %s"),
+    ("max_year", "release_year <= %s"),
+)
 
 
-# fetch details about a single game
-@router.get("/game/{game_id}")
-def get_game(game_id):
+# facet counts as the response lists them, most games first with ties broken
+# by id so the order is stable
+def sort_facets(counts):
+    return {
+        facet.removesuffix("_id"): [
+            {facet: value, "count": count}
+            for value, count in sorted(
+                facet_counts.items(), key=lambda item: (-item[1], item[0])
+            )
+        ]
+        for facet, facet_counts in counts.items()
+    }
+
+
+# count the filtered games per genre, platform and decade. one grouped query
+# does the work, then the groups are folded into the three facets
+def fetch_game_facets(cursor, where, params):
+    facet_query = f"""
+        SELECT genre_id, platform_id, FLOOR(release_year / 10) * 10 AS decade, COUNT(*) AS games
+        FROM game
+        {where}
+        GROUP BY genre_id, platform_id, decade;
+        """
+    cursor.execute(facet_query, params)
+    counts = {"genre_id": {}, "platform_id": {}, "decade": {}}
+    for group in cursor.fetchall():
+        for facet, facet_counts in counts.items():
+            value = int(group[facet])
+            facet_counts[value] = facet_counts.get(value, 0) + group["games"]
+    return counts
+
+
+# a page of /games/ from the database, as (rows, next cursor, facet counts)
+def fetch_games_page(values, limit, after, with_facets):
+    conditions = [
+        condition for name, condition in game_filters if values[name] is not None
+    ]
+    params = tuple(values[name] for name, _ in game_filters if values[name] is not None)
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
-        select_single_game_query = """
-            SELECT g.*, gen.genre_id, gen.name AS genre_name, plat.platform_id, plat.name AS platform_name, pub.publisher_id, pub.name AS publisher_name, d.developer_id, d.name AS developer_name
-            FROM game g
-            JOIN genre gen ON g.genre_id = gen.genre_id
-            JOIN platform plat ON g.platform_id = plat.platform_id
-            JOIN publisher pub ON g.publisher_id = pub.publisher_id
-            JOIN developer d ON g.developer_id = d.developer_id
-            WHERE g.game_id = %s;
+        fetch_games_query = f"""
+            SELECT game_id, title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url
+            FROM game
+            WHERE {" AND ".join(conditions + ["game_id > %s"])}
+            ORDER BY game_id
+            LIMIT %s;
             """
-        cursor.execute(select_single_game_query, (game_id,))
-        game = cursor.fetchone()
+        rows, next_cursor = fetch_game_page(
+            cursor, fetch_games_query, params, limit, after
+        )
+        facet_counts = None
+        if with_facets:
+            facet_counts = fetch_game_facets(cursor, where, params)
+    finally:
+        connection.close()
+    return rows, next_cursor, facet_counts
+
+
+# get games, one page at a time. pass the next_cursor of a page as "after"
+# to get the page that follows it. the filters can be combined, and the first
+# page also carries facet counts for the filtered games unless facets=false
+@router.get(
+    "/games/",
+    dependencies=[Depends(etag_for("game"))],
+    response_model=Detail[GamesPage],
+)
+def get_games(
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+    genre_id: Optional[int] = None,
+    platform_id: Optional[int] = None,
+    publisher_id: Optional[int] = None,
+    developer_id: Optional[int] = None,
+    min_year: Optional[int] = None,
+    max_year: Optional[int] = None,
+    facets: bool = True,
+):
+    values = {
+        "genre_id": genre_id,
+        "platform_id": platform_id,
+        "publisher_id": publisher_id,
+        "developer_id": developer_id,
+        "min_year": min_year,
+        "max_year": max_year,
+    }
+    with_facets = facets and after is None
+
+    try:
+        if CATALOG_ENGINE == "memory":
+            filters = {
+                name.removesuffix("_id"): value for name, value in values.items()
+            }
+            rows, next_cursor, facet_counts = catalog.games_page(
+                filters, limit, after, with_facets
+            )
+        else:
+            rows, next_cursor, facet_counts = fetch_games_page(
+                values, limit, after, with_facets
+            )
+    except HTTPException as http_exception:
+        raise http_exception
+    except PoolTimeoutError:
+        # answered with a 503, see app.main
+        raise
     except Exception as e:
         print(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={"success": False, "message": "An error occurred"},
         )
+
+    return detail_response(
+        {
+            "success": True,
+            "rows": rows,
+            "next_cursor": next_cursor,
+            "facets": sort_facets(facet_counts) if facet_counts is not None else None,
+        }
+    )
+
+
+# stream every game as newline delimited json, for bulk consumers
+@router.get("/games/export")
+def export_games():
+    query = "SELECT game_id, title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url FROM game ORDER BY game_id"
+    rows = get_info_stream(query)
+    return StreamingResponse(rows, media_type="application/x-ndjson")
+
+
+# rank games by relevance with mysql's FULLTEXT index
+def search_games_fulltext(q: str, limit: int, offset: int):
+    # make a database connection
+    connection = get_db_connection()
+    try:
+        # create a cursor object
+        cursor = connection.cursor()
+        search_games_query = """
+            SELECT game_id, title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url,
+                MATCH(title, description) AGAINST (%s IN NATURAL LANGUAGE MODE) AS relevance
+            FROM game
+            WHERE MATCH(title, description) AGAINST (%s IN NATURAL LANGUAGE MODE)
+            ORDER BY relevance DESC, game_id
+            LIMIT %s OFFSET %s;
+            """
+        cursor.execute(search_games_query, (q, q, limit + 1, offset))
+        return cursor.fetchall()
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK, detail={"success": True, "game": game}
-    )
 
+# rank games with the in-process index, then load the page of games by id
+def search_games_in_process(q: str, limit: int, offset: int):
+    ranked = search_index.search(q)[offset : offset + limit + 1]
+    if not ranked:
+        return []
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        placeholders = ", ".join(["%s"] * len(ranked))
+        cursor.execute(
+            f"SELECT game_id, title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url FROM game WHERE game_id IN ({placeholders})",
+            [game_id for game_id, _ in ranked],
+        )
+        games_by_id = {row["game_id"]: row for row in cursor.fetchall()}
+    finally:
+        connection.close()
+    # a game deleted by another worker may still be in this worker's index
+    return [
+        {**games_by_id[game_id], "relevance": score}
+        for game_id, score in ranked
+        if game_id in games_by_id
+    ]
 
-# add a new game to the database
-@router.post("/game/", response_model=User)
-async def post_game(
-    game_data: Game, current_user: Annotated[User, Depends(get_current_user)]
+
+# search game titles and descriptions, best matches first. pass next_offset
+# as offset to get the next page
+@router.get(
+    "/games/search",
+    dependencies=[Depends(etag_for("game"))],
+    response_model=Detail[GameSearch],
+)
+def search_games(
+    q: Annotated[str, Query(min_length=1, max_length=200)],
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    offset: Annotated[int, Query(ge=0, le=SEARCH_MAX_OFFSET)] = 0,
 ):
-    if current_user["role"] != "admin":
+    try:
+        games = None
+        if fulltext_available():
+            try:
+                games = search_games_fulltext(q, limit, offset)
+            except pymysql.err.OperationalError as e:
+                if e.args[0] != ER_FT_MATCHING_KEY_NOT_FOUND:
+                    raise
+                mark_fulltext_unavailable()
+        if games is None:
+            games = search_games_in_process(q, limit, offset)
+    except PoolTimeoutError:
+        # answered with a 503, see app.main
+        raise
+    except Exception as e:
+        print(e)
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"success": False, "message": "You are unauthorized"},
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "An error occurred"},
+        )
+
+    next_offset = None
+    if len(games) > limit:
+        games = games[:limit]
+        next_offset = offset + limit
+
+    return detail_response(
+        {"success": True, "games": games, "next_offset": next_offset}
+    )
+
+
+# fetch the details of many games in one query. ids is a comma separated list,
+# and ids that do not exist are listed under "missing"
+@router.get(
+    "/games/batch",
+    dependencies=[Depends(etag_for(*GAME_LISTING_TABLES, "ratings"))],
+    response_model=Detail[GameBatch],
+)
+def get_games_batch(ids: str):
+    try:
+        # drop repeats but keep the order the client asked for
+        game_ids = list(dict.fromkeys(int(id) for id in ids.split(",") if id.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "message": "ids must be comma separated numbers"},
+        )
+    if not game_ids or len(game_ids) > BATCH_MAX_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={
+                "success": False,
+                "message": f"Between 1 and {BATCH_MAX_IDS} ids can be requested",
+            },
         )
+
+    # make a database connection
+    connection = get_db_connection()
     try:
+        # create a cursor object
+        cursor = connection.cursor()
+        placeholders = ", ".join(["%s"] * len(game_ids))
+        select_games_query = select_game_details + f"WHERE game_id IN ({placeholders});"
+        cursor.execute(select_games_query, game_ids)
+        rows = cursor.fetchall()
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "An error occurred"},
+        )
+    finally:
+        connection.close()
+
+    games_by_id = {row["game_id"]: with_average_rating(row) for row in rows}
+    games = [games_by_id[game_id] for game_id in game_ids if game_id in games_by_id]
+    missing = [game_id for game_id in game_ids if game_id not in games_by_id]
+
+    return detail_response({"success": True, "games": games, "missing": missing})
+
+
+# load the details of ranked games from the catalog or game_card, in rank
+# order. a game deleted by another worker may still be ranked here, so it is
+# skipped
+def fetch_popular_games(ranked):
+    if not ranked:
+        return []
+    if CATALOG_ENGINE == "memory":
+        games_by_id = {game_id: catalog.game(game_id) for game_id, _ in ranked}
+    else:
         connection = get_db_connection()
+        try:
+            cursor = connection.cursor()
+            placeholders = ", ".join(["%s"] * len(ranked))
+            cursor.execute(
+                select_game_details + f"WHERE game_id IN ({placeholders})",
+                [game_id for game_id, _ in ranked],
+            )
+            games_by_id = {
+                row["game_id"]: with_average_rating(row) for row in cursor.fetchall()
+            }
+        finally:
+            connection.close()
+    return [
+        {**games_by_id[game_id], "favourite_count": count}
+        for game_id, count in ranked
+        if games_by_id.get(game_id) is not None
+    ]
+
+
+# the most favourited games, optionally only those on a platform and/or in a
+# genre. ranked from per-game counters kept in process, so no request counts
+# the favourites table
+@router.get(
+    "/games/popular",
+    dependencies=[Depends(etag_for(*GAME_LISTING_TABLES, "ratings", "favourites"))],
+    response_model=Detail[PopularGames],
+)
+def get_popular_games(
+    limit: Annotated[int, Query(ge=1, le=POPULAR_MAX_LIMIT)] = POPULAR_DEFAULT_LIMIT,
+    platform_id: Optional[int] = None,
+    genre_id: Optional[int] = None,
+):
+    try:
+        ranked = leaderboard.top(limit, platform_id, genre_id)
+        games = fetch_popular_games(ranked)
+    except PoolTimeoutError:
+        # answered with a 503, see app.main
+        raise
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "An error occurred"},
+        )
+
+    return detail_response({"success": True, "games": games})
+
+
+# fetch details about a single game
+@router.get(
+    "/game/{game_id}",
+    dependencies=[Depends(etag_for(*GAME_LISTING_TABLES, "ratings"))],
+    response_model=Detail[GameData],
+)
+def get_game(game_id):
+    if CATALOG_ENGINE == "memory":
+        try:
+            game = catalog.game(game_id)
+        except PoolTimeoutError:
+            # answered with a 503, see app.main
+            raise
+        except Exception as e:
+            print(e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={"success": False, "message": "An error occurred"},
+            )
+        return detail_response({"success": True, "game": game})
+
+    # make a database connection
+    connection = get_db_connection()
+    try:
+        # create a cursor object
+        cursor = connection.cursor()
+        select_single_game_query = select_game_details + "WHERE game_id = %s;"
+        cursor.execute(select_single_game_query, (game_id,))
+        game = cursor.fetchone()
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "An error occurred"},
+        )
+    finally:
+        connection.close()
+
+    if game is not None:
+        game = with_average_rating(game)
+    return detail_response({"success": True, "game": game})
+
+
+# insert a game row. runs in the database executor
+def add_game(game_data: Game):
+    connection = get_db_connection()
+    try:
         # gather values from the json object
         title = game_data.title
         description = game_data.description
@@ -96,9 +497,12 @@ async def post_game(
         print(values)
         # create a cursor object
         cursor = connection.cursor()
-        add_game_query = "INSERT INTO game (title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
         cursor.execute(add_game_query, values)
+        game_id = cursor.lastrowid
+        refresh_game_card(cursor, game_id)
         connection.commit()
+        bump_table_version("game")
+        search_index.add(game_id, title, description)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -107,27 +511,31 @@ async def post_game(
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Game added successfully"},
-    )
 
+    # the game is committed, so a failure here reloads the catalog and the
+    # leaderboard instead of failing the request
+    catalog.put_game({"game_id": game_id, **game_data.model_dump()})
+    leaderboard.put_game(game_id, game_data.platform_id, game_data.genre_id)
 
-# edit a video game game
-@router.put("/game/{game_id}", response_model=User)
-async def put_game(
-    game_id: int,
-    game_data: Game,
-    current_user: Annotated[User, Depends(get_current_user)],
+
+# add a new game to the database
+@router.post("/game/", response_model=Detail[Message])
+async def post_game(
+    game_data: Game, current_user: Annotated[User, Depends(get_current_user)]
 ):
-    if current_user["role"] == "user":
+    if current_user["role"] != "admin":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(add_game, game_data)
+    return detail_response({"success": True, "message": "Game added successfully"})
+
+
+# update a game row. runs in the database executor
+def update_game(game_id: int, game_data: Game):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         title = game_data.title
         description = game_data.description
@@ -161,7 +569,10 @@ async def put_game(
             )
         update_game_query = "UPDATE game SET title = %s, description = %s, release_year = %s, genre_id = %s, platform_id = %s, publisher_id = %s, developer_id = %s, image_url = %s WHERE game_id = %s"
         cursor.execute(update_game_query, values)
+        refresh_game_card(cursor, game_id)
         connection.commit()
+        bump_table_version("game")
+        search_index.add(game_id, title, description)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -171,25 +582,31 @@ async def put_game(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Game updated successfully"},
-    )
+    catalog.put_game({"game_id": game_id, **game_data.model_dump()})
+    leaderboard.put_game(game_id, game_data.platform_id, game_data.genre_id)
 
 
-# delete a video game game
-@router.delete("/game/{game_id}", response_model=User)
-async def delete_game(
-    game_id: int, current_user: Annotated[User, Depends(get_current_user)]
+# edit a video game game
+@router.put("/game/{game_id}", response_model=Detail[Message])
+async def put_game(
+    game_id: int,
+    game_data: Game,
+    current_user: Annotated[User, Depends(get_current_user)],
 ):
-    if current_user["role"] != "admin":
+    if current_user["role"] == "user":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(update_game, game_id, game_data)
+
+    return detail_response({"success": True, "message": "Game updated successfully"})
+
+
+# delete a game row. runs in the database executor
+def remove_game(game_id: int):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -200,9 +617,12 @@ async def delete_game(
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, detail="game not found"
             )
+        delete_game_card(cursor, game_id)
         delete_game_query = "DELETE FROM game WHERE game_id = %s"
         cursor.execute(delete_game_query, (game_id,))
         connection.commit()
+        bump_table_version("game")
+        search_index.remove(game_id)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -212,8 +632,204 @@ async def delete_game(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
+    catalog.remove_game(game_id)
+    leaderboard.remove_game(game_id)
+
+
+# delete a video game game
+@router.delete("/game/{game_id}", response_model=Detail[Message])
+async def delete_game(
+    game_id: int, current_user: Annotated[User, Depends(get_current_user)]
+):
+    if current_user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"success": False, "message": "You are unauthorized"},
+        )
+    await run_db(remove_game, game_id)
+
+    return detail_response({"success": True, "message": "Game successfully deleted"})
+
+
+# turn a bulk request body into a list of (row number, data or error) pairs.
+# a body with more than BULK_MAX_ROWS games is refused with a 413
+def parse_bulk_body(body: bytes, content_type: str):
+    if content_type.split(";")[0].strip().lower() in NDJSON_CONTENT_TYPES:
+        try:
+            text = body.decode("utf-8")
+        except UnicodeDecodeError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"success": False, "message": "The body must be UTF-8"},
+            )
+        items = []
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            # stop before parsing the rest of an oversized body
+            if len(items) == BULK_MAX_ROWS:
+                raise_too_many_rows()
+            try:
+                items.append((len(items), json.loads(line), None))
+            except json.JSONDecodeError as e:
+                items.append((len(items), None, f"invalid json: {e.msg}"))
+        return items
+
+    try:
+        data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "message": "The body must be a JSON array"},
+        )
+    if not isinstance(data, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "message": "The body must be a JSON array"},
+        )
+    if len(data) > BULK_MAX_ROWS:
+        raise_too_many_rows()
+    return [(row, item, None) for row, item in enumerate(data)]
+
+
+def raise_too_many_rows():
     raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Game successfully deleted"},
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail={
+            "success": False,
+            "message": f"At most {BULK_MAX_ROWS} games can be imported at once",
+        },
+    )
+
+
+# fetch every id of a lookup table into a set
+def fetch_id_set(cursor, table):
+    cursor.execute(f"SELECT {table}_id FROM {table}")
+    return {row[f"{table}_id"] for row in cursor.fetchall()}
+
+
+# insert validated games chunk by chunk, one transaction per chunk. runs in
+# the database executor and returns (inserted count, per row errors)
+def import_games(games, chunk_size: int):
+    errors = []
+    inserted = 0
+    connection = get_db_connection()
+    try:
+        # create a cursor object
+        cursor = connection.cursor()
+        # check foreign keys here rather than letting one bad row fail a chunk
+        known_ids = {
+            table: fetch_id_set(cursor, table)
+            for table in ("genre", "platform", "publisher", "developer")
+        }
+        values = []
+        for row, game in games:
+            missing = [
+                f"{table}_id {getattr(game, f'{table}_id')} does not exist"
+                for table, ids in known_ids.items()
+                if getattr(game, f"{table}_id") not in ids
+            ]
+            if missing:
+                errors.append({"row": row, "errors": missing})
+                continue
+            values.append(
+                (
+                    row,
+                    (
+                        game.title,
+                        game.description,
+                        game.release_year,
+                        game.genre_id,
+                        game.platform_id,
+                        game.publisher_id,
+                        game.developer_id,
+                        game.image_url,
+                    ),
+                )
+            )
+
+        for start in range(0, len(values), chunk_size):
+            chunk = values[start : start + chunk_size]
+            try:
+                # the chunk's games get ids above the current newest one
+                cursor.execute("SELECT COALESCE(MAX(game_id), 0) AS last_id FROM game")
+                last_id = cursor.fetchone()["last_id"]
+                cursor.executemany(add_game_query, [value for _, value in chunk])
+                add_missing_game_cards(cursor, last_id)
+                connection.commit()
+                inserted += len(chunk)
+            except Exception as e:
+                print(e)
+                connection.rollback()
+                errors.extend(
+                    {"row": row, "errors": ["chunk failed to insert, rolled back"]}
+                    for row, _ in chunk
+                )
+            else:
+                # outside the try, so a catalog failure never reports a
+                # committed chunk as rolled back
+                catalog.add_games_after(cursor, last_id)
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "Failed to import games"},
+        )
+    finally:
+        if inserted:
+            bump_table_version("game")
+            # cheaper to rebuild on the next search than to add rows one by one
+            search_index.invalidate()
+        connection.close()
+    return inserted, errors
+
+
+# add many games in one request. the body is a JSON array of games, or one
+# game per line when sent as application/x-ndjson. valid rows are inserted
+# and each rejected row is reported with its position and errors
+@router.post("/games/bulk", response_model=Detail[BulkImport])
+async def post_games_bulk(
+    request: Request,
+    current_user: Annotated[User, Depends(get_current_user)],
+    chunk_size: Annotated[int, Query(ge=1, le=BULK_MAX_CHUNK_SIZE)] = BULK_CHUNK_SIZE,
+):
+    if current_user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"success": False, "message": "You are unauthorized"},
+        )
+    items = parse_bulk_body(
+        await request.body(), request.headers.get("content-type", "")
+    )
+
+    games = []
+    errors = []
+    for row, data, error in items:
+        if error is not None:
+            errors.append({"row": row, "errors": [error]})
+            continue
+        try:
+            games.append((row, Game.model_validate(data)))
+        except ValidationError as e:
+            errors.append(
+                {
+                    "row": row,
+                    "errors": [
+                        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}"
+                        for err in e.errors()
+                    ],
+                }
+            )
+
+    inserted, import_errors = await run_db(import_games, games, chunk_size)
+    errors.extend(import_errors)
+    errors.sort(key=lambda error: error["row"])
+
+    return detail_response(
+        {
+            "success": not errors,
+            "inserted": inserted,
+            "failed": len(errors),
+            "errors": errors,
+        }
     )
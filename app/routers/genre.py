@@ -1,10 +1,23 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Query, status, Depends
 from pydantic import BaseModel
-from typing import Annotated
-from app.pymysql.databaseConnection import get_db_connection
+from typing import Annotated, Optional
+from app.pymysql.databaseConnection import PoolTimeoutError, get_db_connection
+from app.pymysql.gameCards import rename_in_game_cards
 from app.dependencies import get_current_user
 from app.models.User import User
-from app.utils.db_utils import get_info_data, get_info_list
+from app.models.Responses import Detail, GenreData, GenreGames, GenreRow, Message, Rows
+from app.utils.responses import detail_response
+from app.utils.db_utils import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    get_info_data,
+    get_info_list,
+    run_db,
+    fetch_game_page,
+)
+from app.utils.cache import reference_cache
+from app.utils.catalog import CATALOG_ENGINE, catalog
+from app.utils.etag import GAME_LISTING_TABLES, bump_table_version, etag_for
 
 router = APIRouter()
 
@@ -14,25 +27,68 @@ class Genre(BaseModel):
 
 
 # get all genres
-@router.get("/genres/")
+@router.get(
+    "/genres/",
+    dependencies=[Depends(etag_for("genre"))],
+    response_model=Detail[Rows[GenreRow]],
+)
 def get_genres():
     query = "SELECT genre_id, name FROM genre"
-    get_info_list(query)
+    rows = get_info_list(query, cache_namespace="genre")
+    return detail_response({"success": True, "rows": rows})
 
 
 # fetch all data about a single genre
-@router.get("/genre-data/{genre_id}")
+@router.get(
+    "/genre-data/{genre_id}",
+    dependencies=[Depends(etag_for("genre"))],
+    response_model=Detail[GenreData],
+)
 def get_genre_data(genre_id):
     fetch_genre_data = "SELECT genre_id, name FROM genre WHERE genre_id = %s"
-    get_info_data(fetch_genre_data, "genre", genre_id)
+    data = get_info_data(fetch_genre_data, genre_id, cache_namespace="genre")
+    return detail_response({"success": True, "genre": data})
 
 
 # get all games under that genre
-@router.get("/genre/{genre_id}")
-def get_genre_games(genre_id):
+@router.get(
+    "/genre/{genre_id}",
+    dependencies=[Depends(etag_for(*GAME_LISTING_TABLES))],
+    response_model=Detail[GenreGames],
+)
+def get_genre_games(
+    genre_id: int,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+):
+    if CATALOG_ENGINE == "memory":
+        try:
+            genre_name, games, next_cursor = catalog.listing(
+                "genre", genre_id, limit, after
+            )
+        except HTTPException as http_exception:
+            raise http_exception
+        except PoolTimeoutError:
+            # answered with a 503, see app.main
+            raise
+        except Exception as e:
+            print(e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={"success": False, "message": "An error occurred"},
+            )
+        return detail_response(
+            {
+                "success": True,
+                "games": games,
+                "genre_name": genre_name,
+                "next_cursor": next_cursor,
+            }
+        )
+
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -43,15 +99,17 @@ def get_genre_games(genre_id):
         genre_name = cursor.fetchone()["name"]
 
         fetch_games_by_genre = """
-            SELECT g.game_id, g.title AS game_title, g.image_url, p.name AS platform_name, g.platform_id, g.developer_id, d.name AS developer_name, g.publisher_id, pub.name AS publisher_name
-            FROM game g
-            JOIN platform p ON g.platform_id = p.platform_id
-            JOIN developer d ON g.developer_id = d.developer_id
-            JOIN publisher pub ON g.publisher_id = pub.publisher_id
-            WHERE g.genre_id = %s;
+            SELECT game_id, title AS game_title, image_url, platform_id, platform_name, developer_id, developer_name, publisher_id, publisher_name
+            FROM game_card
+            WHERE genre_id = %s AND game_id > %s
+            ORDER BY game_id
+            LIMIT %s;
             """
-        cursor.execute(fetch_games_by_genre, (genre_id,))
-        games = cursor.fetchall()
+        games, next_cursor = fetch_game_page(
+            cursor, fetch_games_by_genre, (genre_id,), limit, after
+        )
+    except HTTPException as http_exception:
+        raise http_exception
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -61,25 +119,20 @@ def get_genre_games(genre_id):
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "games": games, "genre_name": genre_name},
+    return detail_response(
+        {
+            "success": True,
+            "games": games,
+            "genre_name": genre_name,
+            "next_cursor": next_cursor,
+        }
     )
 
 
-# add a new genre to the database
-@router.post("/genre/", response_model=User)
-async def post_genre(
-    genre_data: Genre, current_user: Annotated[User, Depends(get_current_user)]
-):
-    if current_user["role"] != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"success": False, "message": "You are unauthorized"},
-        )
+# insert a genre row. runs in the database executor
+def add_genre(genre_data: Genre):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         name = genre_data.name
 
@@ -88,6 +141,10 @@ async def post_genre(
         add_genre_query = "INSERT INTO genre (name) VALUES (%s)"
         cursor.execute(add_genre_query, (name,))
         connection.commit()
+        # the cached genre lists are stale now
+        reference_cache.invalidate("genre")
+        bump_table_version("genre")
+        catalog.put_lookup("genre", cursor.lastrowid, name)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -96,27 +153,26 @@ async def post_genre(
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Genre added successfully"},
-    )
 
 
-# edit a video game genre
-@router.put("/genre/{genre_id}", response_model=User)
-async def put_genre(
-    genre_id: int,
-    genre_data: Genre,
-    current_user: Annotated[User, Depends(get_current_user)],
+# add a new genre to the database
+@router.post("/genre/", response_model=Detail[Message])
+async def post_genre(
+    genre_data: Genre, current_user: Annotated[User, Depends(get_current_user)]
 ):
-    if current_user["role"] == "user":
+    if current_user["role"] != "admin":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(add_genre, genre_data)
+    return detail_response({"success": True, "message": "Genre added successfully"})
+
+
+# update a genre row. runs in the database executor
+def update_genre(genre_id: int, genre_data: Genre):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         name = genre_data.name
 
@@ -131,7 +187,12 @@ async def put_genre(
             )
         update_genre_query = "UPDATE genre SET name = %s WHERE genre_id = %s"
         cursor.execute(update_genre_query, (name, genre_id))
+        rename_in_game_cards(cursor, "genre", genre_id, name)
         connection.commit()
+        # the cached genre lists are stale now
+        reference_cache.invalidate("genre")
+        bump_table_version("genre")
+        catalog.put_lookup("genre", genre_id, name)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -141,25 +202,28 @@ async def put_genre(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Genre updated successfully"},
-    )
-
 
-# delete a video game genre
-@router.delete("/genre/{genre_id}", response_model=User)
-async def delete_genre(
-    genre_id: int, current_user: Annotated[User, Depends(get_current_user)]
+# edit a video game genre
+@router.put("/genre/{genre_id}", response_model=Detail[Message])
+async def put_genre(
+    genre_id: int,
+    genre_data: Genre,
+    current_user: Annotated[User, Depends(get_current_user)],
 ):
-    if current_user["role"] != "admin":
+    if current_user["role"] == "user":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(update_genre, genre_id, genre_data)
+
+    return detail_response({"success": True, "message": "Genre updated successfully"})
+
+
+# delete a genre row. runs in the database executor
+def remove_genre(genre_id: int):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -173,6 +237,10 @@ async def delete_genre(
         delete_genre_query = "DELETE FROM genre WHERE genre_id = %s"
         cursor.execute(delete_genre_query, (genre_id,))
         connection.commit()
+        # the cached genre lists are stale now
+        reference_cache.invalidate("genre")
+        bump_table_version("genre")
+        catalog.remove_lookup("genre", genre_id)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -182,8 +250,17 @@ async def delete_genre(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Genre successfully deleted"},
-    )
+
+# delete a video game genre
+@router.delete("/genre/{genre_id}", response_model=Detail[Message])
+async def delete_genre(
+    genre_id: int, current_user: Annotated[User, Depends(get_current_user)]
+):
+    if current_user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"success": False, "message": "You are unauthorized"},
+        )
+    await run_db(remove_genre, genre_id)
+
+    return detail_response({"success": True, "message": "Genre successfully deleted"})
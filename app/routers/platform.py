@@ -1,11 +1,31 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Query, status, Depends
 from pydantic import BaseModel, HttpUrl, validator
 from typing import Optional, Annotated
-from app.pymysql.databaseConnection import get_db_connection
+from app.pymysql.databaseConnection import PoolTimeoutError, get_db_connection
+from app.pymysql.gameCards import rename_in_game_cards
 from app.dependencies import get_current_user
 from app.models.User import User
+from app.models.Responses import (
+    Detail,
+    Message,
+    PlatformData,
+    PlatformGames,
+    PlatformRow,
+    Rows,
+)
 import re
-from app.utils.db_utils import get_info_data, get_info_list
+from app.utils.responses import detail_response
+from app.utils.db_utils import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    get_info_data,
+    get_info_list,
+    run_db,
+    fetch_game_page,
+)
+from app.utils.cache import reference_cache
+from app.utils.catalog import CATALOG_ENGINE, catalog
+from app.utils.etag import GAME_LISTING_TABLES, bump_table_version, etag_for
 
 router = APIRouter()
 
@@ -28,27 +48,70 @@ class Platform(BaseModel):
 
 
 # get all platforms
-@router.get("/platforms/")
+@router.get(
+    "/platforms/",
+    dependencies=[Depends(etag_for("platform"))],
+    response_model=Detail[Rows[PlatformRow]],
+)
 def get_platforms():
     query = "SELECT platform_id, name, logo_url FROM platform"
-    get_info_list(query)
+    rows = get_info_list(query, cache_namespace="platform")
+    return detail_response({"success": True, "rows": rows})
 
 
 # fetch all data about single platform
-@router.get("/platform-data/{platform_id}")
+@router.get(
+    "/platform-data/{platform_id}",
+    dependencies=[Depends(etag_for("platform"))],
+    response_model=Detail[PlatformData],
+)
 def get_platform_data(platform_id):
     fetch_platform_data = (
         "SELECT platform_id, name, logo_url FROM platform WHERE platform_id = %s"
     )
-    get_info_data(fetch_platform_data, "platform", platform_id)
+    data = get_info_data(fetch_platform_data, platform_id, cache_namespace="platform")
+    return detail_response({"success": True, "platform": data})
 
 
 # get all games for a platform
-@router.get("/platform/{platform_id}")
-def get_platform_games(platform_id: int):
+@router.get(
+    "/platform/{platform_id}",
+    dependencies=[Depends(etag_for(*GAME_LISTING_TABLES))],
+    response_model=Detail[PlatformGames],
+)
+def get_platform_games(
+    platform_id: int,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+):
+    if CATALOG_ENGINE == "memory":
+        try:
+            platform_name, games, next_cursor = catalog.listing(
+                "platform", platform_id, limit, after
+            )
+        except HTTPException as http_exception:
+            raise http_exception
+        except PoolTimeoutError:
+            # answered with a 503, see app.main
+            raise
+        except Exception as e:
+            print(e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={"success": False, "message": "An error occurred"},
+            )
+        return detail_response(
+            {
+                "success": True,
+                "games": games,
+                "platform_name": platform_name,
+                "next_cursor": next_cursor,
+            }
+        )
+
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
         fetch_platform_info_query = """
@@ -58,16 +121,18 @@ def get_platform_games(platform_id: int):
         platform_name = cursor.fetchone()["name"]
 
         fetch_games_for_platform_query = """
-            SELECT g.game_id, g.title AS game_title, g.image_url, gen.name AS genre_name, g.genre_id, g.developer_id, d.name AS developer_name, g.publisher_id, pub.name AS publisher_name
-            FROM game g
-            JOIN genre gen ON g.genre_id = gen.genre_id
-            JOIN developer d ON d.developer_id = g.developer_id
-            JOIN publisher pub ON pub.publisher_id = g.publisher_id
-            WHERE g.platform_id = %s;
+            SELECT game_id, title AS game_title, image_url, genre_id, genre_name, developer_id, developer_name, publisher_id, publisher_name
+            FROM game_card
+            WHERE platform_id = %s AND game_id > %s
+            ORDER BY game_id
+            LIMIT %s;
             """
 
-        cursor.execute(fetch_games_for_platform_query, (platform_id,))
-        games = cursor.fetchall()
+        games, next_cursor = fetch_game_page(
+            cursor, fetch_games_for_platform_query, (platform_id,), limit, after
+        )
+    except HTTPException as http_exception:
+        raise http_exception
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -77,25 +142,20 @@ def get_platform_games(platform_id: int):
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "games": games, "platform_name": platform_name},
+    return detail_response(
+        {
+            "success": True,
+            "games": games,
+            "platform_name": platform_name,
+            "next_cursor": next_cursor,
+        }
     )
 
 
-# add a new platform to the database
-@router.post("/platform/", response_model=User)
-async def post_platform(
-    platform_data: Platform, current_user: Annotated[User, Depends(get_current_user)]
-):
-    if current_user["role"] != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"success": False, "message": "You are unauthorized"},
-        )
+# insert a platform row. runs in the database executor
+def add_platform(platform_data: Platform):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         name = platform_data.name
         logo_url = platform_data.logo_url
@@ -105,6 +165,10 @@ async def post_platform(
         add_platform_query = "INSERT INTO platform (name, logo_url) VALUES (%s, %s)"
         cursor.execute(add_platform_query, (name, logo_url))
         connection.commit()
+        # the cached platform lists are stale now
+        reference_cache.invalidate("platform")
+        bump_table_version("platform")
+        catalog.put_lookup("platform", cursor.lastrowid, name)
     except HTTPException as http_exception:
         raise http_exception
     except Exception as e:
@@ -115,28 +179,26 @@ async def post_platform(
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Platform added successfully"},
-    )
 
 
-# edit a video game platform
-@router.put("/platform/{platform_id}", response_model=User)
-async def put_platform(
-    platform_id: int,
-    platform_data: Platform,
-    current_user: Annotated[User, Depends(get_current_user)],
+# add a new platform to the database
+@router.post("/platform/", response_model=Detail[Message])
+async def post_platform(
+    platform_data: Platform, current_user: Annotated[User, Depends(get_current_user)]
 ):
-    if current_user["role"] == "user":
+    if current_user["role"] != "admin":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(add_platform, platform_data)
+    return detail_response({"success": True, "message": "Platform added successfully"})
+
 
+# update a platform row. runs in the database executor
+def update_platform(platform_id: int, platform_data: Platform):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object and make a tuple for the sql query
         name = platform_data.name
         logo_url = platform_data.logo_url
@@ -156,7 +218,12 @@ async def put_platform(
             "UPDATE platform SET name = %s, logo_url = %s WHERE platform_id = %s"
         )
         cursor.execute(update_platform_query, values)
+        rename_in_game_cards(cursor, "platform", platform_id, name)
         connection.commit()
+        # the cached platform lists are stale now
+        reference_cache.invalidate("platform")
+        bump_table_version("platform")
+        catalog.put_lookup("platform", platform_id, name)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -166,25 +233,30 @@ async def put_platform(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Platform updated successfully"},
-    )
-
 
-# delete a video game platform
-@router.delete("/platform/{platform_id}", response_model=User)
-async def delete_platform(
-    platform_id: int, current_user: Annotated[User, Depends(get_current_user)]
+# edit a video game platform
+@router.put("/platform/{platform_id}", response_model=Detail[Message])
+async def put_platform(
+    platform_id: int,
+    platform_data: Platform,
+    current_user: Annotated[User, Depends(get_current_user)],
 ):
-    if current_user["role"] != "admin":
+    if current_user["role"] == "user":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(update_platform, platform_id, platform_data)
+
+    return detail_response(
+        {"success": True, "message": "Platform updated successfully"}
+    )
+
+
+# delete a platform row. runs in the database executor
+def remove_platform(platform_id: int):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -198,6 +270,10 @@ async def delete_platform(
         delete_platform_query = "DELETE FROM platform WHERE platform_id = %s"
         cursor.execute(delete_platform_query, (platform_id,))
         connection.commit()
+        # the cached platform lists are stale now
+        reference_cache.invalidate("platform")
+        bump_table_version("platform")
+        catalog.remove_lookup("platform", platform_id)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -207,8 +283,19 @@ async def delete_platform(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Platform successfully deleted"},
+
+# delete a video game platform
+@router.delete("/platform/{platform_id}", response_model=Detail[Message])
+async def delete_platform(
+    platform_id: int, current_user: Annotated[User, Depends(get_current_user)]
+):
+    if current_user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"success": False, "message": "You are unauthorized"},
+        )
+    await run_db(remove_platform, platform_id)
+
+    return detail_response(
+        {"success": True, "message": "Platform successfully deleted"}
     )
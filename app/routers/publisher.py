@@ -1,10 +1,30 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, Query, status, Depends
 from pydantic import BaseModel
-from typing import Annotated
-from app.pymysql.databaseConnection import get_db_connection
+from typing import Annotated, Optional
+from app.pymysql.databaseConnection import PoolTimeoutError, get_db_connection
+from app.pymysql.gameCards import rename_in_game_cards
 from app.dependencies import get_current_user
 from app.models.User import User
-from app.utils.db_utils import get_info_data, get_info_list
+from app.models.Responses import (
+    Detail,
+    Message,
+    PublisherData,
+    PublisherGames,
+    PublisherRow,
+    Rows,
+)
+from app.utils.responses import detail_response
+from app.utils.db_utils import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    get_info_data,
+    get_info_list,
+    run_db,
+    fetch_game_page,
+)
+from app.utils.cache import reference_cache
+from app.utils.catalog import CATALOG_ENGINE, catalog
+from app.utils.etag import GAME_LISTING_TABLES, bump_table_version, etag_for
 
 router = APIRouter()
 
@@ -14,27 +34,72 @@ class Publisher(BaseModel):
 
 
 # get publishers
-@router.get("/publishers/")
+@router.get(
+    "/publishers/",
+    dependencies=[Depends(etag_for("publisher"))],
+    response_model=Detail[Rows[PublisherRow]],
+)
 def get_publishers():
     query = "SELECT publisher_id, name FROM publisher"
-    get_info_list(query)
+    rows = get_info_list(query, cache_namespace="publisher")
+    return detail_response({"success": True, "rows": rows})
 
 
 # fetch all data about a single publisher
-@router.get("/publisher-data/{publisher_id}")
+@router.get(
+    "/publisher-data/{publisher_id}",
+    dependencies=[Depends(etag_for("publisher"))],
+    response_model=Detail[PublisherData],
+)
 def get_publisher_data(publisher_id):
     fetch_publisher_data = (
         "SELECT publisher_id, name FROM publisher WHERE publisher_id = %s"
     )
-    get_info_data(fetch_publisher_data, "publisher", publisher_id)
+    data = get_info_data(
+        fetch_publisher_data, publisher_id, cache_namespace="publisher"
+    )
+    return detail_response({"success": True, "publisher": data})
 
 
 # get all games released by the publisher
-@router.get("/publisher/{publisher_id}")
-def get_publisher_games(publisher_id):
+@router.get(
+    "/publisher/{publisher_id}",
+    dependencies=[Depends(etag_for(*GAME_LISTING_TABLES))],
+    response_model=Detail[PublisherGames],
+)
+def get_publisher_games(
+    publisher_id: int,
+    limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+    after: Optional[str] = None,
+):
+    if CATALOG_ENGINE == "memory":
+        try:
+            publisher_name, games, next_cursor = catalog.listing(
+                "publisher", publisher_id, limit, after
+            )
+        except HTTPException as http_exception:
+            raise http_exception
+        except PoolTimeoutError:
+            # answered with a 503, see app.main
+            raise
+        except Exception as e:
+            print(e)
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={"success": False, "message": "An error occurred"},
+            )
+        return detail_response(
+            {
+                "success": True,
+                "games": games,
+                "publisher_name": publisher_name,
+                "next_cursor": next_cursor,
+            }
+        )
+
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -45,15 +110,17 @@ def get_publisher_games(publisher_id):
         publisher_name = cursor.fetchone()["name"]
 
         fetch_games_by_publisher = """
-            SELECT g.game_id, g.title AS game_title, g.image_url, g.platform_id, p.name AS platform_name, g.genre_id, gen.name AS genre_name, g.developer_id, d.name AS developer_name
-            FROM game g
-            JOIN platform p ON g.platform_id = p.platform_id
-            JOIN genre gen ON g.genre_id = gen.genre_id
-            JOIN developer d ON g.developer_id = d.developer_id
-            WHERE g.developer_id = %s;
+            SELECT game_id, title AS game_title, image_url, platform_id, platform_name, genre_id, genre_name, developer_id, developer_name
+            FROM game_card
+            WHERE publisher_id = %s AND game_id > %s
+            ORDER BY game_id
+            LIMIT %s;
             """
-        cursor.execute(fetch_games_by_publisher, (publisher_id,))
-        games = cursor.fetchall()
+        games, next_cursor = fetch_game_page(
+            cursor, fetch_games_by_publisher, (publisher_id,), limit, after
+        )
+    except HTTPException as http_exception:
+        raise http_exception
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -63,25 +130,20 @@ def get_publisher_games(publisher_id):
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "games": games, "publisher_name": publisher_name},
+    return detail_response(
+        {
+            "success": True,
+            "games": games,
+            "publisher_name": publisher_name,
+            "next_cursor": next_cursor,
+        }
     )
 
 
-# add a new publisher to the database
-@router.post("/publisher/", response_model=User)
-async def post_publisher(
-    publisher_data: Publisher, current_user: Annotated[User, Depends(get_current_user)]
-):
-    if current_user["role"] != "admin":
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail={"success": False, "message": "You are unauthorized"},
-        )
+# insert a publisher row. runs in the database executor
+def add_publisher(publisher_data: Publisher):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         name = publisher_data.name
 
@@ -90,6 +152,10 @@ async def post_publisher(
         add_publisher_query = "INSERT INTO publisher (name) VALUES (%s)"
         cursor.execute(add_publisher_query, (name,))
         connection.commit()
+        # the cached publisher lists are stale now
+        reference_cache.invalidate("publisher")
+        bump_table_version("publisher")
+        catalog.put_lookup("publisher", cursor.lastrowid, name)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -98,27 +164,26 @@ async def post_publisher(
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Publisher added successfully"},
-    )
 
 
-# edit a video game publisher
-@router.put("/publisher/{publisher_id}", response_model=User)
-async def put_publisher(
-    publisher_id: int,
-    publisher_data: Publisher,
-    current_user: Annotated[User, Depends(get_current_user)],
+# add a new publisher to the database
+@router.post("/publisher/", response_model=Detail[Message])
+async def post_publisher(
+    publisher_data: Publisher, current_user: Annotated[User, Depends(get_current_user)]
 ):
-    if current_user["role"] == "user":
+    if current_user["role"] != "admin":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(add_publisher, publisher_data)
+    return detail_response({"success": True, "message": "Publisher added successfully"})
+
+
+# update a publisher row. runs in the database executor
+def update_publisher(publisher_id: int, publisher_data: Publisher):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # gather values from the json object
         name = publisher_data.name
 
@@ -137,7 +202,12 @@ async def put_publisher(
             "UPDATE publisher SET name = %s WHERE publisher_id = %s"
         )
         cursor.execute(update_publisher_query, (name, publisher_id))
+        rename_in_game_cards(cursor, "publisher", publisher_id, name)
         connection.commit()
+        # the cached publisher lists are stale now
+        reference_cache.invalidate("publisher")
+        bump_table_version("publisher")
+        catalog.put_lookup("publisher", publisher_id, name)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -146,25 +216,30 @@ async def put_publisher(
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Publisher updated successfully"},
-    )
 
 
-# delete a video game publisher
-@router.delete("/publisher/{publisher_id}", response_model=User)
-async def delete_publisher(
-    publisher_id: int, current_user: Annotated[User, Depends(get_current_user)]
+# edit a video game publisher
+@router.put("/publisher/{publisher_id}", response_model=Detail[Message])
+async def put_publisher(
+    publisher_id: int,
+    publisher_data: Publisher,
+    current_user: Annotated[User, Depends(get_current_user)],
 ):
-    if current_user["role"] != "admin":
+    if current_user["role"] == "user":
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail={"success": False, "message": "You are unauthorized"},
         )
+    await run_db(update_publisher, publisher_id, publisher_data)
+    return detail_response(
+        {"success": True, "message": "Publisher updated successfully"}
+    )
+
+
+# delete a publisher row. runs in the database executor
+def remove_publisher(publisher_id: int):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
 
@@ -180,6 +255,10 @@ async def delete_publisher(
         delete_publisher_query = "DELETE FROM publisher WHERE publisher_id = %s"
         cursor.execute(delete_publisher_query, (publisher_id,))
         connection.commit()
+        # the cached publisher lists are stale now
+        reference_cache.invalidate("publisher")
+        bump_table_version("publisher")
+        catalog.remove_lookup("publisher", publisher_id)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -189,8 +268,19 @@ async def delete_publisher(
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "Publisher successfully deleted"},
+
+# delete a video game publisher
+@router.delete("/publisher/{publisher_id}", response_model=Detail[Message])
+async def delete_publisher(
+    publisher_id: int, current_user: Annotated[User, Depends(get_current_user)]
+):
+    if current_user["role"] != "admin":
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail={"success": False, "message": "You are unauthorized"},
+        )
+    await run_db(remove_publisher, publisher_id)
+
+    return detail_response(
+        {"success": True, "message": "Publisher successfully deleted"}
     )
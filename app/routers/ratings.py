@@ -0,0 +1,273 @@
+import pymysql
+from fastapi import APIRouter, HTTPException, status, Depends
+from pydantic import BaseModel, Field
+from typing import Annotated
+from datetime import datetime
+from app.pymysql.databaseConnection import get_db_connection
+from app.pymysql.gameCards import add_to_card_ratings, with_average_rating
+from app.dependencies import get_current_user
+from app.models.User import User
+from app.models.Responses import Detail, Message, RatingSummaryData
+from app.utils.catalog import catalog
+from app.utils.responses import detail_response
+from app.utils.db_utils import run_db
+from app.utils.etag import bump_table_version, etag_for
+
+router = APIRouter()
+
+# the scores a game can be given. game keeps a count of each in rating_<score>
+MIN_SCORE = 1
+MAX_SCORE = 5
+SCORES = range(MIN_SCORE, MAX_SCORE + 1)
+
+# mysql error for a duplicate key
+ER_DUP_ENTRY = 1062
+
+select_rating_summary = f"""
+    SELECT game_id, rating_count, rating_sum, {", ".join(f"rating_{score}" for score in SCORES)}
+    FROM game
+    WHERE game_id = %s;
+    """
+
+
+class Rating(BaseModel):
+    game_id: int
+    score: Annotated[int, Field(ge=MIN_SCORE, le=MAX_SCORE)]
+
+
+class RatingUpdate(BaseModel):
+    score: Annotated[int, Field(ge=MIN_SCORE, le=MAX_SCORE)]
+
+
+# add a rating being given (added) and/or taken back (removed) to the game's
+# aggregates. call it in the same transaction as the change to ratings, so
+# the aggregates always match the rows. returns the change in the rating
+# count and sum
+def update_rating_aggregates(cursor, game_id: int, added=None, removed=None):
+    changes = {"rating_count": 0, "rating_sum": 0}
+    for score, sign in ((added, 1), (removed, -1)):
+        if score is not None:
+            changes["rating_count"] += sign
+            changes["rating_sum"] += sign * score
+            changes[f"rating_{score}"] = changes.get(f"rating_{score}", 0) + sign
+    changes = {column: change for column, change in changes.items() if change}
+    if not changes:
+        return 0, 0
+    assignments = ", ".join(f"{column} = {column} + %s" for column in changes)
+    cursor.execute(
+        f"UPDATE game SET {assignments} WHERE game_id = %s",
+        (*changes.values(), game_id),
+    )
+    count = changes.get("rating_count", 0)
+    total = changes.get("rating_sum", 0)
+    add_to_card_ratings(cursor, game_id, count, total)
+    return count, total
+
+
+# call once a rating change has committed
+def ratings_changed(game_id: int, count: int, total: int):
+    bump_table_version("ratings")
+    catalog.add_rating(game_id, count, total)
+
+
+# the user's rating of a game, locked until the transaction ends, or None
+def fetch_own_rating(cursor, user_id: int, game_id: int):
+    cursor.execute(
+        "SELECT rating_id, score FROM ratings WHERE user_id = %s AND game_id = %s FOR UPDATE",
+        (user_id, game_id),
+    )
+    return cursor.fetchone()
+
+
+# read a game's rating summary. runs in the database executor
+def fetch_rating_summary(game_id: int):
+    # make a database connection
+    connection = get_db_connection()
+    try:
+        # create a cursor object
+        cursor = connection.cursor()
+        cursor.execute(select_rating_summary, (game_id,))
+        game = cursor.fetchone()
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "An error occurred"},
+        )
+    finally:
+        connection.close()
+
+    if game is None:
+        return None
+    return with_average_rating(
+        {
+            "game_id": game["game_id"],
+            "rating_count": game["rating_count"],
+            "rating_sum": game["rating_sum"],
+            "histogram": [
+                {"score": score, "count": game[f"rating_{score}"]} for score in SCORES
+            ],
+        }
+    )
+
+
+# get how a game has been rated: the number of ratings, their average and how
+# many gave each score. rating is None when the game does not exist
+@router.get(
+    "/ratings/{game_id}",
+    dependencies=[Depends(etag_for("game", "ratings"))],
+    response_model=Detail[RatingSummaryData],
+)
+async def get_rating_summary(game_id: int):
+    rating = await run_db(fetch_rating_summary, game_id)
+
+    return detail_response({"success": True, "rating": rating})
+
+
+# insert the user's rating of a game. runs in the database executor
+def add_rating(user_id: int, game_id: int, score: int):
+    connection = get_db_connection()
+    try:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # create a cursor object
+        cursor = connection.cursor()
+        cursor.execute("SELECT game_id FROM game WHERE game_id = %s", (game_id,))
+        if not cursor.fetchone():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Game not found"
+            )
+        if fetch_own_rating(cursor, user_id, game_id):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Rating already exists",
+            )
+
+        add_rating_query = "INSERT INTO ratings (game_id, user_id, score, timestamp) VALUES (%s, %s, %s, %s)"
+        cursor.execute(add_rating_query, (game_id, user_id, score, timestamp))
+        count, total = update_rating_aggregates(cursor, game_id, added=score)
+        connection.commit()
+        ratings_changed(game_id, count, total)
+    except HTTPException as http_exception:
+        raise http_exception
+    except pymysql.err.IntegrityError as e:
+        # the unique index caught a second rating sent at the same time
+        if e.args[0] == ER_DUP_ENTRY:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Rating already exists",
+            )
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "Failed to add rating"},
+        )
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "Failed to add rating"},
+        )
+    finally:
+        connection.close()
+
+
+# rate a game
+@router.post("/ratings/", response_model=Detail[Message])
+async def post_rating(
+    rating_data: Rating,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    await run_db(
+        add_rating, current_user["user_id"], rating_data.game_id, rating_data.score
+    )
+    return detail_response({"success": True, "message": "Rating added successfully"})
+
+
+# change the score of the user's rating. runs in the database executor
+def update_rating(user_id: int, game_id: int, score: int):
+    connection = get_db_connection()
+    try:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # create a cursor object
+        cursor = connection.cursor()
+        # check if the entry exists first
+        rating = fetch_own_rating(cursor, user_id, game_id)
+        if not rating:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Rating not found"
+            )
+        update_rating_query = (
+            "UPDATE ratings SET score = %s, timestamp = %s WHERE rating_id = %s"
+        )
+        cursor.execute(update_rating_query, (score, timestamp, rating["rating_id"]))
+        count, total = update_rating_aggregates(
+            cursor, game_id, added=score, removed=rating["score"]
+        )
+        connection.commit()
+        ratings_changed(game_id, count, total)
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to update rating",
+        )
+    finally:
+        connection.close()
+
+
+# change the user's rating of a game
+@router.put("/ratings/{game_id}", response_model=Detail[Message])
+async def put_rating(
+    game_id: int,
+    rating_data: RatingUpdate,
+    current_user: Annotated[User, Depends(get_current_user)],
+):
+    await run_db(update_rating, current_user["user_id"], game_id, rating_data.score)
+
+    return detail_response({"success": True, "message": "Rating updated successfully"})
+
+
+# delete the user's rating of a game. runs in the database executor
+def remove_rating(user_id: int, game_id: int):
+    connection = get_db_connection()
+    try:
+        # create a cursor object
+        cursor = connection.cursor()
+
+        # check if the entry exists first
+        rating = fetch_own_rating(cursor, user_id, game_id)
+        if not rating:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND, detail="Rating not found"
+            )
+        delete_rating_query = "DELETE FROM ratings WHERE rating_id = %s"
+        cursor.execute(delete_rating_query, (rating["rating_id"],))
+        count, total = update_rating_aggregates(
+            cursor, game_id, removed=rating["score"]
+        )
+        connection.commit()
+        ratings_changed(game_id, count, total)
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to delete rating",
+        )
+    finally:
+        connection.close()
+
+
+# take back the user's rating of a game
+@router.delete("/ratings/{game_id}", response_model=Detail[Message])
+async def delete_rating(
+    game_id: int, current_user: Annotated[User, Depends(get_current_user)]
+):
+    await run_db(remove_rating, current_user["user_id"], game_id)
+
+    return detail_response({"success": True, "message": "Rating successfully deleted"})
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, HTTPException
+from app.models.Responses import Tokens
 from app.utils.auth_utils import (
     create_access_token,
     verify_refresh_token,
@@ -8,7 +9,7 @@ from app.utils.auth_utils import (
 router = APIRouter()
 
 
-@router.post("/token/refresh")
+@router.post("/token/refresh", response_model=Tokens)
 async def refresh_access_token(refresh_token: str):
     try:
         # Verify the refresh token
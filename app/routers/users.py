@@ -5,13 +5,25 @@ from typing import Annotated
 from datetime import datetime
 from app.pymysql.databaseConnection import get_db_connection
 from app.utils.auth_utils import (
-    verify_password,
-    get_password_hash,
+    hash_password,
+    verify_and_update_password,
     create_access_token,
     create_refresh_token,
+    invalidate_user,
 )
 from app.dependencies import get_current_user
 from app.models.User import User
+from app.models.Responses import Detail, Message, Tokens
+from app.utils.responses import detail_response
+from app.utils.db_utils import run_db
+from app.utils.rate_limit import (
+    email_key,
+    enforce,
+    limit_login_ip,
+    limit_register_ip,
+    login_email_limiter,
+    register_email_limiter,
+)
 
 
 router = APIRouter()
@@ -30,16 +42,10 @@ class UserLogin(BaseModel):
     password: str
 
 
-# user registration
-@router.post("/users/register")
-def post_user_register(user_registration: UserRegistration):
+# insert a user row. runs in the database executor
+def add_user(username: str, email: str, hashed_password: str):
+    connection = get_db_connection()
     try:
-        connection = get_db_connection()
-        # gather values from the json object
-        username = user_registration.username
-        email = user_registration.email
-        # hash the password here
-        hashed_password = get_password_hash(user_registration.password)
         # generate the datetime, and format it to the mysql requirement
         join_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -50,6 +56,7 @@ def post_user_register(user_registration: UserRegistration):
         add_user_query = "INSERT INTO users (username, email, password, join_date) VALUES (%s, %s, %s, %s)"
         cursor.execute(add_user_query, values)
         connection.commit()
+        invalidate_user(email)
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -58,30 +65,34 @@ def post_user_register(user_registration: UserRegistration):
         )
     finally:
         connection.close()
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK,
-        detail={"success": True, "message": "User added successfully"},
+
+
+# user registration
+@router.post(
+    "/users/register",
+    response_model=Detail[Message],
+    dependencies=[Depends(limit_register_ip)],
+)
+async def post_user_register(user_registration: UserRegistration):
+    enforce(register_email_limiter, email_key(user_registration.email))
+    # hash the password here, on the password threads
+    hashed_password = await hash_password(user_registration.password)
+    await run_db(
+        add_user,
+        user_registration.username,
+        user_registration.email,
+        hashed_password,
     )
+    return detail_response({"success": True, "message": "User added successfully"})
 
 
-# user login
-@router.post("/users/login")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+# look up the user logging in. runs in the database executor
+def fetch_login_user(email: str):
+    connection = get_db_connection()
     try:
-        email = form_data.username
-        password = form_data.password
-
-        # Check if user exists and verify password
-        connection = get_db_connection()
         cursor = connection.cursor()
         cursor.execute("SELECT * FROM users WHERE email = %s", (email,))
-        user = cursor.fetchone()
-        if not user or not verify_password(password, user["password"]):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Incorrect email or password",
-            )
+        return cursor.fetchone()
     except Exception as e:
         print(e)
         raise HTTPException(
@@ -91,6 +102,52 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     finally:
         connection.close()
 
+
+# store a rehashed password. only replaces the hash the login was checked
+# against, so a password changed in the meantime is not overwritten
+def update_password_hash(user: dict, new_hash: str):
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "UPDATE users SET password = %s WHERE user_id = %s AND password = %s",
+            (new_hash, user["user_id"], user["password"]),
+        )
+        connection.commit()
+        invalidate_user(user["email"])
+    except Exception as e:
+        # the old hash still works, so the login goes ahead
+        print(e)
+    finally:
+        connection.close()
+
+
+# user login. attempts are rate limited per client ip and per email, as
+# every attempt costs a bcrypt verification
+@router.post(
+    "/users/login", response_model=Tokens, dependencies=[Depends(limit_login_ip)]
+)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    email = form_data.username
+    password = form_data.password
+    enforce(login_email_limiter, email_key(email))
+    user = await run_db(fetch_login_user, email)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect email or password",
+        )
+    # bcrypt runs on the password threads, away from the event loop
+    verified, new_hash = await verify_and_update_password(password, user["password"])
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Incorrect email or password",
+        )
+    # the stored hash was made with an older bcrypt cost, upgrade it
+    if new_hash:
+        await run_db(update_password_hash, user, new_hash)
+
     # Generate access and refresh tokens
     access_token = create_access_token(data={"sub": user["email"]})
     refresh_token = create_refresh_token(data={"sub": user["email"]})
@@ -1,17 +1,35 @@
+import asyncio
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-import jwt
 from dotenv import load_dotenv
-from jwt import ExpiredSignatureError, InvalidTokenError
-from passlib.context import CryptContext
+from fastapi import HTTPException, status
 
 from app.pymysql.databaseConnection import get_db_connection
+from app.utils.cache import MISSING, TTLCache
 
 load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor for new hashes. each step doubles the time a hash takes.
+# hashes made with fewer rounds are upgraded the next time the user logs in
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# threads doing password hashing. bcrypt releases the gil while it hashes, so
+# these run in parallel with each other and with request handling
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))
+# most password jobs running or waiting at once. past this, logins and
+# registrations are turned away with a 503 instead of queueing without bound
+PASSWORD_QUEUE_LIMIT = int(os.getenv("PASSWORD_QUEUE_LIMIT", str(PASSWORD_WORKERS * 8)))
+
+_pwd_context = None
+_password_executor = None
+_password_lock = threading.Lock()
+# password jobs submitted and not finished yet
+_password_jobs = 0
 
 
 # jwt stuff. secret generated with:
@@ -22,30 +40,155 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
 
+# user rows looked up by get_current_user, keyed by email. the ttl is kept
+# short so changes made straight in mysql (like a role change) show up quickly
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "30")),
+)
+
+
+# claims of access tokens that have been verified, keyed by a digest of the
+# token. an entry expires when its token does, so a hit can skip checking the
+# signature and expiry again
+token_cache = TTLCache(
+    maxsize=int(os.getenv("TOKEN_CACHE_SIZE", "4096")),
+    ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+)
+
+
+# passlib and bcrypt are only needed to log in and register, so they are
+# imported on first use rather than on every cold start
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        with _password_lock:
+            if _pwd_context is None:
+                from passlib.context import CryptContext
+
+                _pwd_context = CryptContext(
+                    schemes=["bcrypt"],
+                    deprecated="auto",
+                    bcrypt__rounds=BCRYPT_ROUNDS,
+                    bcrypt__min_rounds=BCRYPT_ROUNDS,
+                )
+    return _pwd_context
+
 
 # verify the user inputted password to a hashed password
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 # hash and salt a password
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+
+def get_password_executor():
+    global _password_executor
+    if _password_executor is None:
+        with _password_lock:
+            if _password_executor is None:
+                _password_executor = ThreadPoolExecutor(
+                    max_workers=PASSWORD_WORKERS, thread_name_prefix="password"
+                )
+    return _password_executor
+
+
+def shutdown_password_executor():
+    global _password_executor
+    with _password_lock:
+        if _password_executor is not None:
+            _password_executor.shutdown(wait=True)
+            _password_executor = None
+
+
+# run a bcrypt call on the password threads, so it neither blocks the event
+# loop nor ties up the database threads. raises a 503 when too many are queued
+async def run_password_job(func, *args):
+    global _password_jobs
+    with _password_lock:
+        if _password_jobs >= PASSWORD_QUEUE_LIMIT:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={"success": False, "message": "Server busy, try again shortly"},
+                headers={"Retry-After": "1"},
+            )
+        _password_jobs += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_password_executor(), func, *args)
+    finally:
+        with _password_lock:
+            _password_jobs -= 1
+
+
+# password jobs running or queued, exported on /metrics
+def password_jobs():
+    return _password_jobs
+
+
+async def hash_password(password):
+    return await run_password_job(get_password_hash, password)
+
+
+# check a password and, when the stored hash uses an old cost or scheme, get
+# a new hash for it. returns (verified, new hash or None)
+async def verify_and_update_password(plain_password, hashed_password):
+    return await run_password_job(
+        get_pwd_context().verify_and_update, plain_password, hashed_password
+    )
 
 
 # check if the user exists in the database
 def get_user(email: str):
+    user = user_cache.get(("users", email))
+    if user is not MISSING:
+        return user
+    generation = user_cache.generation("users")
+
     connection = get_db_connection()
     cursor = connection.cursor()
     cursor.execute("SELECT * FROM users WHERE email = %s", email)
     user = cursor.fetchone()
     cursor.close()
     connection.close()
+
+    # unknown emails are not cached, so a new account works straight away
+    if user is not None:
+        user_cache.set(("users", email), user, generation=generation)
     return user
 
 
+# drop a cached user row, call this after writing to the user's row
+def invalidate_user(email: str):
+    user_cache.delete(("users", email))
+
+
+# check an access token and return its claims. raises jwt's InvalidTokenError
+# (or a subclass like ExpiredSignatureError) for a bad or expired token
+def decode_access_token(token: str):
+    key = ("token", hashlib.sha256(token.encode()).digest())
+    claims = token_cache.get(key)
+    if claims is not MISSING:
+        return claims
+    # jwt (and the cryptography package it loads) is imported when first
+    # needed, like passlib above
+    import jwt
+
+    claims = jwt.decode(token, JWT_SECRET_KEY, algorithms=[ALGORITHM])
+    # exp is optional in a jwt, tokens without one are not cached
+    expires_in = claims.get("exp", 0) - time.time()
+    if expires_in > 0:
+        token_cache.set(key, claims, ttl=expires_in)
+    return claims
+
+
 # create the access token
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -63,6 +206,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 # create the refresh token
 def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
+    import jwt
+
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.now(timezone.utc) + expires_delta
@@ -79,13 +224,16 @@ def create_refresh_token(data: dict, expires_delta: Optional[timedelta] = None):
 
 
 def update_refresh_token(refresh_token: str):
+    import jwt
+    from jwt import ExpiredSignatureError, InvalidTokenError
+
     try:
         payload = jwt.decode(
             refresh_token, JWT_REFRESH_SECRET_KEY, algorithms=["HS256"]
         )
 
-        if datetime.now(datetime.UTC) < datetime.fromtimestamp(datetime.UTC)(
-            payload["exp"]
+        if datetime.now(timezone.utc) < datetime.fromtimestamp(
+            payload["exp"], timezone.utc
         ):
             to_encode = payload
             encoded_jwt = jwt.encode(
@@ -101,6 +249,9 @@ def update_refresh_token(refresh_token: str):
 
 
 def verify_refresh_token(refresh_token: str):
+    import jwt
+    from jwt import ExpiredSignatureError, InvalidTokenError
+
     try:
         # Verify the token's signature
         payload = jwt.decode(
@@ -108,8 +259,8 @@ def verify_refresh_token(refresh_token: str):
         )
 
         # Check token expiration
-        if datetime.now(datetime.UTC) > datetime.fromtimestamp(datetime.UTC)(
-            payload["exp"]
+        if datetime.now(timezone.utc) > datetime.fromtimestamp(
+            payload["exp"], timezone.utc
         ):
             # Token has expired
             return None
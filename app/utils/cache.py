@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# returned by get() when a key is not cached, since None is a valid value
+MISSING = object()
+
+
+# a thread safe in-process cache with a time to live and a least recently
+# used size bound. keys are tuples whose first item is a namespace (usually
+# a table name), so everything cached for a table can be evicted at once
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # key -> (expires_at, value), least recently used first
+        self._data = OrderedDict()
+        # bumped on every invalidation so reads that started before a write
+        # cannot put stale rows back into the cache
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    # the generation to pass to set() for a value about to be loaded
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def set(self, key, value, generation=None, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if (
+                generation is not None
+                and self._generations.get(key[0], 0) != generation
+            ):
+                return
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    # drop one entry, called after a write to the row it caches. its
+    # namespace's generation is bumped too, so a read of the old row that is
+    # still in flight cannot put it back
+    def delete(self, key):
+        with self._lock:
+            self._generations[key[0]] = self._generations.get(key[0], 0) + 1
+            self._data.pop(key, None)
+
+    # drop every entry in a namespace, called after writes to that table
+    def invalidate(self, namespace):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            for key in [key for key in self._data if key[0] == namespace]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+            }
+
+
+# cache for the platform, genre, developer and publisher lists and their
+# *-data/{id} lookups. these tables only change through the admin routes
+reference_cache = TTLCache(
+    maxsize=int(os.getenv("REFERENCE_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("REFERENCE_CACHE_TTL", "300")),
+)
@@ -0,0 +1,353 @@
+import os
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter
+from itertools import islice
+
+from app.pymysql.databaseConnection import get_db_connection, use_primary
+from app.pymysql.gameCards import LOOKUP_TABLES, with_average_rating
+from app.utils.db_utils import decode_cursor, encode_cursor
+from app.utils.reloading import ReloadingCopy
+
+# "memory" serves /games/, /game/{id} and the per platform, genre, publisher
+# and developer listings from an in-process copy of the catalog. "sql" (the
+# default) reads them from the database
+CATALOG_ENGINE = os.getenv("CATALOG_ENGINE", "sql")
+# reload from the database after this many seconds, so writes handled by
+# other workers are picked up
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))
+
+# game columns held in integer arrays, and the text ones held in lists
+GAME_INT_COLUMNS = (
+    "game_id",
+    "release_year",
+    "genre_id",
+    "platform_id",
+    "publisher_id",
+    "developer_id",
+    "rating_count",
+    "rating_sum",
+)
+GAME_TEXT_COLUMNS = ("title", "description", "image_url")
+# every column read from the game table
+GAME_COLUMNS = GAME_INT_COLUMNS + GAME_TEXT_COLUMNS
+# the order /games/ returns a game's columns in
+GAME_ROW_COLUMNS = (
+    "game_id",
+    "title",
+    "description",
+    "release_year",
+    "genre_id",
+    "platform_id",
+    "publisher_id",
+    "developer_id",
+    "image_url",
+)
+
+
+# one table held column by column. each column has a slot per row, ints in a
+# compact array and text in a list, and rows are found by id through an index
+class ColumnTable:
+    def __init__(self, key, int_columns, text_columns):
+        self.key = key
+        self.columns = {name: array("q") for name in int_columns}
+        self.columns.update({name: [] for name in text_columns})
+        # id -> row number
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.rows)
+
+    # add a row, or overwrite it when its id is already there. columns left
+    # out of values keep their value, or start at 0 (None for text) in a new row
+    def put(self, values):
+        index = self.rows.get(values[self.key])
+        if index is None:
+            self.rows[values[self.key]] = len(self.rows)
+            for name, column in self.columns.items():
+                default = 0 if isinstance(column, array) else None
+                column.append(values.get(name, default))
+        else:
+            for name, column in self.columns.items():
+                if name in values:
+                    column[index] = values[name]
+
+    # move the last row into the removed row's slot, so the columns stay dense
+    def remove(self, id):
+        index = self.rows.pop(id, None)
+        if index is None:
+            return
+        last = len(self.rows)
+        for column in self.columns.values():
+            if index != last:
+                column[index] = column[last]
+            column.pop()
+        if index != last:
+            self.rows[self.columns[self.key][index]] = index
+
+
+# the catalog tables plus the indexes the listings read through
+class CatalogData:
+    def __init__(self):
+        self.games = ColumnTable("game_id", GAME_INT_COLUMNS, GAME_TEXT_COLUMNS)
+        self.lookups = {
+            table: ColumnTable(f"{table}_id", (f"{table}_id",), ("name",))
+            for table in LOOKUP_TABLES
+        }
+        # every game id in order, for the unfiltered listing
+        self.game_ids = array("q")
+        # table -> lookup id -> sorted array of the ids of its games
+        self.postings = {table: {} for table in LOOKUP_TABLES}
+
+    # add or update a game. returns False, leaving the catalog as it was, when
+    # the game points at a lookup row this catalog has not loaded
+    def put_game(self, values):
+        if any(
+            values[f"{table}_id"] not in self.lookups[table].rows
+            for table in LOOKUP_TABLES
+        ):
+            return False
+        game_id = values["game_id"]
+        index = self.games.rows.get(game_id)
+        if index is None:
+            insort(self.game_ids, game_id)
+        for table in LOOKUP_TABLES:
+            column = f"{table}_id"
+            if index is not None:
+                if self.games.columns[column][index] == values[column]:
+                    continue
+                self._unlist(table, self.games.columns[column][index], game_id)
+            insort(self.postings[table].setdefault(values[column], array("q")), game_id)
+        self.games.put(values)
+        return True
+
+    def remove_game(self, game_id):
+        index = self.games.rows.get(game_id)
+        if index is None:
+            return True
+        for table in LOOKUP_TABLES:
+            self._unlist(table, self.games.columns[f"{table}_id"][index], game_id)
+        del self.game_ids[bisect_left(self.game_ids, game_id)]
+        self.games.remove(game_id)
+        return True
+
+    # add to a game's rating count and sum
+    def add_rating(self, game_id, count, total):
+        index = self.games.rows.get(game_id)
+        if index is not None:
+            self.games.columns["rating_count"][index] += count
+            self.games.columns["rating_sum"][index] += total
+        return True
+
+    def _unlist(self, table, id, game_id):
+        game_ids = self.postings[table][id]
+        del game_ids[bisect_left(game_ids, game_id)]
+        if not game_ids:
+            del self.postings[table][id]
+
+    def put_lookup(self, table, id, name):
+        self.lookups[table].put({f"{table}_id": id, "name": name})
+        return True
+
+    # the database refuses to delete a row that games still point at, so
+    # there are no postings to clean up
+    def remove_lookup(self, table, id):
+        self.lookups[table].remove(id)
+        return True
+
+    # raises KeyError for an unknown id
+    def lookup_name(self, table, id):
+        lookup = self.lookups[table]
+        return lookup.columns["name"][lookup.rows[id]]
+
+    # ids of the games matching the filters, in order, after the given id.
+    # filters maps a table to an id, plus optional min_year and max_year
+    def match(self, filters, after=0):
+        tables = [table for table in LOOKUP_TABLES if filters.get(table) is not None]
+        min_year = filters.get("min_year")
+        max_year = filters.get("max_year")
+        # walk the shortest posting list and check the rest of the filters
+        # against the columns
+        candidates = self.game_ids
+        if tables:
+            candidates = min(
+                (self.postings[table].get(filters[table], ()) for table in tables),
+                key=len,
+            )
+        checks = [
+            (self.games.columns[f"{table}_id"], filters[table]) for table in tables
+        ]
+        years = self.games.columns["release_year"]
+        rows = self.games.rows
+        for position in range(bisect_right(candidates, after), len(candidates)):
+            game_id = candidates[position]
+            index = rows[game_id]
+            if min_year is not None and years[index] < min_year:
+                continue
+            if max_year is not None and years[index] > max_year:
+                continue
+            if all(column[index] == value for column, value in checks):
+                yield game_id
+
+    def game_row(self, game_id):
+        index = self.games.rows[game_id]
+        columns = self.games.columns
+        return {name: columns[name][index] for name in GAME_ROW_COLUMNS}
+
+    # a game with the names of its lookup rows and its rating, as read from
+    # game_card
+    def game_details(self, game_id):
+        game = self.game_row(game_id)
+        for table in LOOKUP_TABLES:
+            game[f"{table}_name"] = self.lookup_name(table, game[f"{table}_id"])
+        index = self.games.rows[game_id]
+        game["rating_count"] = self.games.columns["rating_count"][index]
+        game["rating_sum"] = self.games.columns["rating_sum"][index]
+        return with_average_rating(game)
+
+    # games per genre, platform and decade among the filtered games
+    def facet_counts(self, filters):
+        columns = self.games.columns
+        if any(value is not None for value in filters.values()):
+            rows = self.games.rows
+            indexes = [rows[game_id] for game_id in self.match(filters)]
+            genres = (columns["genre_id"][index] for index in indexes)
+            platforms = (columns["platform_id"][index] for index in indexes)
+            years = (columns["release_year"][index] for index in indexes)
+        else:
+            genres = columns["genre_id"]
+            platforms = columns["platform_id"]
+            years = columns["release_year"]
+        return {
+            "genre_id": Counter(genres),
+            "platform_id": Counter(platforms),
+            "decade": Counter(year // 10 * 10 for year in years),
+        }
+
+    # one keyset page of a table's games, as the per entity listings return it
+    def listed_games(self, table, id, after, limit):
+        others = [other for other in LOOKUP_TABLES if other != table]
+        games = []
+        for game_id in islice(self.match({table: id}, after), limit):
+            index = self.games.rows[game_id]
+            columns = self.games.columns
+            game = {
+                "game_id": game_id,
+                "game_title": columns["title"][index],
+                "image_url": columns["image_url"][index],
+            }
+            for other in others:
+                other_id = columns[f"{other}_id"][index]
+                game[f"{other}_id"] = other_id
+                game[f"{other}_name"] = self.lookup_name(other, other_id)
+            games.append(game)
+        return games
+
+
+# read the five tables into a new catalog
+def fetch_catalog():
+    data = CatalogData()
+    # a replica may not have this worker's latest writes yet, and those would
+    # stay missing until the next reload
+    use_primary()
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        for table in LOOKUP_TABLES:
+            cursor.execute(f"SELECT {table}_id, name FROM {table}")
+            for row in cursor.fetchall():
+                data.put_lookup(table, row[f"{table}_id"], row["name"])
+        cursor.execute(f"SELECT {', '.join(GAME_COLUMNS)} FROM game ORDER BY game_id")
+        for row in cursor.fetchall():
+            data.put_game(row)
+    finally:
+        connection.close()
+    return data
+
+
+# in-process, column oriented copy of the games and their lookup tables,
+# used when CATALOG_ENGINE is "memory". it loads on first use and the write
+# handlers apply their changes to it once they have committed
+class Catalog(ReloadingCopy):
+    def __init__(self):
+        super().__init__(fetch_catalog, CATALOG_TTL)
+
+    def put_game(self, values):
+        self._apply("put_game", values)
+
+    def remove_game(self, game_id):
+        self._apply("remove_game", game_id)
+
+    def put_lookup(self, table, id, name):
+        self._apply("put_lookup", table, id, name)
+
+    def remove_lookup(self, table, id):
+        self._apply("remove_lookup", table, id)
+
+    def add_rating(self, game_id, count, total):
+        self._apply("add_rating", game_id, count, total, additive=True)
+
+    # load the games added after after_game_id, used after a bulk insert.
+    # skipped when the catalog is not in use
+    def add_games_after(self, cursor, after_game_id):
+        if self._data is None and self._pending is None:
+            return
+        try:
+            cursor.execute(
+                f"SELECT {', '.join(GAME_COLUMNS)} FROM game WHERE game_id > %s ORDER BY game_id",
+                (after_game_id,),
+            )
+            rows = cursor.fetchall()
+        except Exception as e:
+            # the games are committed already, so reload rather than fail
+            print(e)
+            self.invalidate()
+            return
+        for row in rows:
+            self.put_game(row)
+
+    # a game with its lookup names, or None
+    def game(self, game_id):
+        try:
+            game_id = int(game_id)
+        except ValueError:
+            return None
+        self.ensure_loaded()
+        with self._lock:
+            if game_id not in self._data.games.rows:
+                return None
+            return self._data.game_details(game_id)
+
+    # a keyset page of /games/ as (rows, next cursor, facet counts). the facet
+    # counts are None unless with_facets is set
+    def games_page(self, filters, limit, after, with_facets):
+        after_id = decode_cursor(after)
+        self.ensure_loaded()
+        with self._lock:
+            data = self._data
+            game_ids = list(islice(data.match(filters, after_id), limit + 1))
+            rows = [data.game_row(game_id) for game_id in game_ids[:limit]]
+            facet_counts = data.facet_counts(filters) if with_facets else None
+        return rows, next_page(game_ids, limit), facet_counts
+
+    # a keyset page of one genre, platform, publisher or developer's games as
+    # (its name, games, next cursor). an unknown id raises KeyError
+    def listing(self, table, id, limit, after):
+        after_id = decode_cursor(after)
+        self.ensure_loaded()
+        with self._lock:
+            data = self._data
+            name = data.lookup_name(table, id)
+            games = data.listed_games(table, id, after_id, limit + 1)
+        next_cursor = next_page([game["game_id"] for game in games], limit)
+        return name, games[:limit], next_cursor
+
+
+# the cursor for the page after a page of game ids fetched with one extra id
+def next_page(game_ids, limit):
+    if len(game_ids) > limit:
+        return encode_cursor(game_ids[limit - 1])
+    return None
+
+
+catalog = Catalog()
@@ -0,0 +1,272 @@
+import gzip
+import hashlib
+import os
+import time
+import zlib
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+from app.utils.cache import MISSING, TTLCache
+from app.utils.etag import ETAG_WINDOW
+from app.utils.metrics import Counter, Histogram, registry
+
+# responses smaller than this many bytes are sent as they are, compressing
+# them costs more than it saves
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "5"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+# bodies at least this big are compressed on a worker thread. zlib and brotli
+# release the gil, so the event loop keeps serving other requests meanwhile
+COMPRESS_IN_THREAD_SIZE = 64 * 1024
+# compressed bodies of responses with an etag, kept so the same body is not
+# compressed again on every request
+COMPRESSED_CACHE_SIZE = int(os.getenv("COMPRESSED_CACHE_SIZE", "256"))
+# larger bodies are compressed every time rather than held in memory
+COMPRESSED_CACHE_MAX_BODY = 1024 * 1024
+
+# content types worth compressing, matched by prefix
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+# (etag, encoding) -> (digest of the body, compressed body). an etag only
+# changes with the table versions and the etag window, so entries live as long
+# as the window. the digest catches a body that changed under the same etag,
+# e.g. after a write made by another worker
+compressed_cache = TTLCache(maxsize=COMPRESSED_CACHE_SIZE, ttl=ETAG_WINDOW)
+
+compression_seconds = registry.register(
+    Counter(
+        "retrogame_compression_cpu_seconds_total",
+        "CPU time spent compressing response bodies, by encoding",
+        ("encoding",),
+    )
+)
+compression_input = registry.register(
+    Counter(
+        "retrogame_compression_input_bytes_total",
+        "Bytes of compressed responses before compression, by encoding",
+        ("encoding",),
+    )
+)
+compression_output = registry.register(
+    Counter(
+        "retrogame_compression_output_bytes_total",
+        "Bytes of compressed responses after compression, by encoding",
+        ("encoding",),
+    )
+)
+compression_ratio = registry.register(
+    Histogram(
+        "retrogame_compression_ratio",
+        "Compressed size over original size of each compressed response",
+        ("encoding",),
+        buckets=(0.05, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75, 1),
+    )
+)
+
+# the brotli module, False when it is not installed, None until looked for
+_brotli = None
+
+
+# brotli is optional. without it responses are only gzipped
+def get_brotli():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+        except ImportError:
+            brotli = False
+        _brotli = brotli
+    return _brotli or None
+
+
+# pick the encoding to send from an Accept-Encoding header, or None. brotli is
+# preferred over gzip when the client rates them the same
+def choose_encoding(accept_encoding):
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+    candidates = ("br", "gzip") if get_brotli() is not None else ("gzip",)
+    best, best_weight = None, 0.0
+    for encoding in candidates:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+# compresses a body sent in chunks. each chunk is flushed, so a streamed
+# response reaches the client as it is produced
+class StreamCompressor:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = get_brotli().Compressor(quality=BROTLI_QUALITY)
+        else:
+            # wbits 31 writes the gzip header and trailer
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self):
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+    # compress the next chunk of the body, and end the stream after the last
+    def chunk(self, data, last):
+        started = time.thread_time()
+        chunk = self.compress(data) if data else b""
+        if last:
+            chunk += self.finish()
+        compression_seconds.inc(self.encoding, amount=time.thread_time() - started)
+        return chunk
+
+
+def compress_body(body, encoding):
+    if encoding == "br":
+        return get_brotli().compress(body, quality=BROTLI_QUALITY)
+    # a fixed mtime, so the same body always compresses to the same bytes
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+# compress a whole body, reusing the cached result for the same etag
+def compress_cached(body, encoding, etag):
+    if etag is None or len(body) > COMPRESSED_CACHE_MAX_BODY:
+        return timed(compress_body, body, encoding)
+    key = ("compressed", etag, encoding)
+    digest = hashlib.blake2b(body, digest_size=16).digest()
+    cached = compressed_cache.get(key)
+    if cached is not MISSING and cached[0] == digest:
+        return cached[1]
+    compressed = timed(compress_body, body, encoding)
+    compressed_cache.set(key, (digest, compressed))
+    return compressed
+
+
+# run a compression call and add its cpu time to the metrics
+def timed(func, data, encoding):
+    started = time.thread_time()
+    result = func(data, encoding)
+    compression_seconds.inc(encoding, amount=time.thread_time() - started)
+    return result
+
+
+# run a compression call, on a worker thread when the data is big
+async def run_compression(size, func, *args):
+    if size >= COMPRESS_IN_THREAD_SIZE:
+        return await run_in_threadpool(func, *args)
+    return func(*args)
+
+
+def record_sizes(encoding, size, compressed_size):
+    compression_input.inc(encoding, amount=size)
+    compression_output.inc(encoding, amount=compressed_size)
+    if size:
+        compression_ratio.observe(compressed_size / size, encoding)
+
+
+# compresses responses with gzip, or brotli when it is installed and the
+# client accepts it. must wrap ETagMiddleware, as the etag of a response is
+# what its compressed body is cached under
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        # None when the client takes no encoding we have. the response still
+        # gets a Vary header, so shared caches keep the two apart
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+
+        start = None
+        # None until the first body chunk decides, then False to pass the
+        # response through or a StreamCompressor for a streamed one
+        streaming = None
+        sizes = [0, 0]
+
+        async def send_compressed(message):
+            nonlocal start, streaming
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if streaming is None:
+                headers = MutableHeaders(raw=list(start.get("headers", [])))
+                compressible = not headers.get("content-encoding") and headers.get(
+                    "content-type", ""
+                ).startswith(COMPRESSIBLE_TYPES)
+                not_modified = start["status"] == 304
+                if compressible or not_modified:
+                    headers.add_vary_header("Accept-Encoding")
+                # a compressed body is another representation of the resource,
+                # so its etag can only be a weak one. a 304 has to carry the
+                # etag its 200 would, and cannot tell whether that body would
+                # have been big enough to compress, so every etag sent to a
+                # client that takes an encoding is weak
+                etag = headers.get("etag")
+                if (
+                    encoding is not None
+                    and (compressible or not_modified)
+                    and etag is not None
+                    and not etag.startswith("W/")
+                ):
+                    headers["etag"] = "W/" + etag
+                if (
+                    encoding is None
+                    or not compressible
+                    or (not more_body and len(body) < COMPRESSION_MIN_SIZE)
+                ):
+                    streaming = False
+                    await send({**start, "headers": headers.raw})
+                    await send(message)
+                    return
+
+                headers["content-encoding"] = encoding
+                if not more_body:
+                    compressed = await run_compression(
+                        len(body), compress_cached, body, encoding, etag
+                    )
+                    record_sizes(encoding, len(body), len(compressed))
+                    headers["content-length"] = str(len(compressed))
+                    await send({**start, "headers": headers.raw})
+                    await send({**message, "body": compressed})
+                    return
+
+                del headers["content-length"]
+                streaming = StreamCompressor(encoding)
+                await send({**start, "headers": headers.raw})
+            elif streaming is False:
+                await send(message)
+                return
+
+            chunk = await run_compression(
+                len(body), streaming.chunk, body, not more_body
+            )
+            sizes[0] += len(body)
+            sizes[1] += len(chunk)
+            if not more_body:
+                record_sizes(encoding, *sizes)
+            await send({**message, "body": chunk})
+
+        await self.app(scope, receive, send_compressed)
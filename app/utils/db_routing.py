@@ -0,0 +1,50 @@
+from app.pymysql.databaseConnection import (
+    MYSQL_REPLICA_HOSTS,
+    REPLICA,
+    REPLICA_MAX_LAG,
+    db_route,
+)
+from app.utils.cache import MISSING, TTLCache
+
+READ_METHODS = ("GET", "HEAD")
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+
+# clients that made a write in the last REPLICA_MAX_LAG seconds, keyed by
+# client ip. their reads go to the primary so they see their own writes
+_recent_writers = TTLCache(maxsize=100000, ttl=REPLICA_MAX_LAG)
+
+
+def _client_key(scope):
+    client = scope.get("client")
+    return ("writer", client[0] if client else "unknown")
+
+
+# sends GET and HEAD requests to the read replicas, unless the same client
+# wrote something recently. writes stay on the primary and mark the client
+# as a recent writer once they finish. run uvicorn with --proxy-headers
+# behind a proxy, or every client looks like the proxy and reads mostly go
+# to the primary
+class ReadRoutingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not MYSQL_REPLICA_HOSTS:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        key = _client_key(scope)
+        if method in READ_METHODS and _recent_writers.get(key) is MISSING:
+            token = db_route.set(REPLICA)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                db_route.reset(token)
+        elif method in WRITE_METHODS:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _recent_writers.set(key, True)
+        else:
+            await self.app(scope, receive, send)
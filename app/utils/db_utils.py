@@ -1,11 +1,78 @@
+import asyncio
+import base64
+import binascii
+import contextvars
+import functools
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+import pymysql.cursors
 from fastapi import HTTPException, status
-from app.pymysql.databaseConnection import get_db_connection
+from app.pymysql.databaseConnection import (
+    POOL_MAX_SIZE,
+    PoolTimeoutError,
+    get_db_connection,
+)
+from app.utils.cache import MISSING, reference_cache
+
+# number of threads running blocking database work for async handlers. it
+# matches the pool size so a worker never sits waiting for a connection
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", str(POOL_MAX_SIZE)))
+
+# page sizes for the keyset paginated game listings
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+# rows sent per chunk when streaming newline delimited json
+STREAM_BATCH_SIZE = 500
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_db_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=DB_EXECUTOR_WORKERS, thread_name_prefix="db"
+                )
+    return _executor
+
+
+def shutdown_db_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
 
+# run a blocking database function from an async handler without stalling
+# the event loop. context variables are carried over into the worker thread
+async def run_db(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_db_executor(), call)
 
-def get_info_list(info_query):
+
+# fetch every row of a query. pass cache_namespace (the table name) to serve
+# repeat calls from the reference cache until that table is written to
+def get_info_list(info_query, cache_namespace=None):
+    if cache_namespace is not None:
+        cache_key = (cache_namespace, "list", info_query)
+        rows = reference_cache.get(cache_key)
+        if rows is not MISSING:
+            return rows
+        generation = reference_cache.generation(cache_namespace)
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
         cursor.execute(info_query)
@@ -19,16 +86,22 @@ def get_info_list(info_query):
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK, detail={"success": True, "rows": rows}
-    )
+    if cache_namespace is not None:
+        reference_cache.set(cache_key, rows, generation=generation)
+    return rows
 
 
-def get_info_data(info_query, info, id):
+# fetch a single row by id, or None, cached the same way as get_info_list
+def get_info_data(info_query, id, cache_namespace=None):
+    if cache_namespace is not None:
+        cache_key = (cache_namespace, "data", str(id))
+        data = reference_cache.get(cache_key)
+        if data is not MISSING:
+            return data
+        generation = reference_cache.generation(cache_namespace)
+    # make a database connection
+    connection = get_db_connection()
     try:
-        # make a database connection
-        connection = get_db_connection()
         # create a cursor object
         cursor = connection.cursor()
         # fetch_platform_data = "SELECT * FROM developer WHERE developer_id = %s"
@@ -43,7 +116,81 @@ def get_info_data(info_query, info, id):
     finally:
         connection.close()
 
-    # on successful operation, send status 200 and messages
-    raise HTTPException(
-        status_code=status.HTTP_200_OK, detail={"success": True, info: data}
-    )
+    if cache_namespace is not None:
+        reference_cache.set(cache_key, data, generation=generation)
+    return data
+
+
+# turn the last game_id of a page into an opaque cursor for the next page
+def encode_cursor(game_id: int):
+    raw = json.dumps({"game_id": game_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+# read the game_id back out of a cursor. no cursor means the first page
+def decode_cursor(cursor):
+    if cursor is None:
+        return 0
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        game_id = json.loads(base64.urlsafe_b64decode(padded))["game_id"]
+        if not isinstance(game_id, int):
+            raise ValueError
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"success": False, "message": "Invalid cursor"},
+        )
+    return game_id
+
+
+# run a keyset paginated game query. the query must end with
+# "game_id > %s ORDER BY game_id LIMIT %s", and one extra row is fetched to
+# know whether there is a next page
+def fetch_game_page(cursor, query, params, limit, after):
+    cursor.execute(query, (*params, decode_cursor(after), limit + 1))
+    rows = cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["game_id"])
+    return rows, next_cursor
+
+
+# write rows from an unbuffered cursor as newline delimited json. the
+# connection is returned to the pool once the stream ends or the client leaves
+def stream_ndjson(connection, cursor):
+    try:
+        while True:
+            rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+            if not rows:
+                break
+            yield b"".join(orjson.dumps(row, default=str) + b"\n" for row in rows)
+    finally:
+        # closing an unbuffered cursor reads off whatever the client did not take
+        cursor.close()
+        connection.close()
+
+
+# run the query on a server side cursor and hand back a row stream. the query
+# runs before anything is sent, so a failure still turns into a 500
+def get_info_stream(info_query, params=()):
+    connection = None
+    try:
+        # make a database connection
+        connection = get_db_connection()
+        # rows are read from the server as they are sent, not all up front
+        cursor = connection.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute(info_query, params)
+    except PoolTimeoutError:
+        # answered with a 503, see app.main
+        raise
+    except Exception as e:
+        print(e)
+        if connection is not None:
+            connection.close()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail={"success": False, "message": "An error occurred"},
+        )
+    return stream_ndjson(connection, cursor)
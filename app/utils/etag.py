@@ -0,0 +1,107 @@
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+from fastapi import HTTPException, Request, status
+
+from app.pymysql.databaseConnection import REPLICA_MAX_LAG, use_primary
+
+# etags are only valid for this many seconds. the version counters live in
+# this process, so a write handled by another worker is not seen here; the
+# window bounds how long a client can keep getting 304s for changed data
+ETAG_WINDOW = int(os.getenv("ETAG_WINDOW", "60"))
+
+# unique per process, so etags from other workers or before a restart never match
+_PROCESS_ID = uuid.uuid4().hex[:8]
+
+# every table a joined game listing reads from
+GAME_LISTING_TABLES = ("game", "genre", "platform", "publisher", "developer")
+
+# table name -> version, bumped by the write handlers after they commit
+_table_versions = {}
+# table name -> time.monotonic() of the last bump
+_table_changed_at = {}
+_lock = threading.Lock()
+
+
+# mark tables as changed so etags built from them stop matching
+def bump_table_version(*tables):
+    now = time.monotonic()
+    with _lock:
+        for table in tables:
+            _table_versions[table] = _table_versions.get(table, 0) + 1
+            _table_changed_at[table] = now
+
+
+def get_table_version(table):
+    return _table_versions.get(table, 0)
+
+
+# whether any of the tables was written to in the last `seconds`
+def changed_within(tables, seconds):
+    since = time.monotonic() - seconds
+    return any(_table_changed_at.get(table, since) > since for table in tables)
+
+
+def make_etag(request: Request, tables):
+    versions = ".".join(str(get_table_version(table)) for table in tables)
+    window = int(time.time() // ETAG_WINDOW)
+    # different pages and filters of the same route get different etags
+    target = request.url.path + "?" + request.url.query
+    digest = hashlib.blake2b(target.encode(), digest_size=8).hexdigest()
+    return f'"{_PROCESS_ID}-{window}-{versions}-{digest}"'
+
+
+def etag_matches(etag, if_none_match):
+    if if_none_match.strip() == "*":
+        return True
+    # clients may send several etags, and weak ones compare equal to strong ones
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+
+# route dependency for conditional GETs. it answers a matching If-None-Match
+# with a 304 before the handler (and its query) runs, otherwise it leaves the
+# etag on the request for ETagMiddleware to add to the response
+def etag_for(*tables):
+    async def check_etag(request: Request):
+        # a replica may not have a fresh write yet. reading it then would
+        # tag old rows with the new version (and refill the reference cache
+        # with them), so those reads go to the primary
+        if changed_within(tables, REPLICA_MAX_LAG):
+            use_primary()
+        etag = make_etag(request, tables)
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag_matches(etag, if_none_match):
+            raise HTTPException(
+                status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag}
+            )
+        request.state.etag = etag
+
+    return check_etag
+
+
+# adds the etag worked out by etag_for to successful responses
+class ETagMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                etag = scope.get("state", {}).get("etag")
+                if etag is not None:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"etag", etag.encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
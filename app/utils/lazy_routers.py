@@ -0,0 +1,28 @@
+from app.routers import ROUTER_FOR_SEGMENT, ROUTERS, import_router
+
+
+# includes each router the first time a request needs it, so a cold start
+# only pays for building the routes it serves. the openapi schema needs
+# every route, so asking for it loads them all
+class LazyRouterMiddleware:
+    def __init__(self, app, fastapi_app):
+        self.app = app
+        self.fastapi_app = fastapi_app
+        self.loaded = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and len(self.loaded) < len(ROUTERS):
+            path = scope["path"]
+            if path == self.fastapi_app.openapi_url:
+                for name in ROUTERS:
+                    self.load(name)
+            else:
+                name = ROUTER_FOR_SEGMENT.get(path.split("/", 2)[1])
+                if name is not None:
+                    self.load(name)
+        await self.app(scope, receive, send)
+
+    def load(self, name):
+        if name not in self.loaded:
+            self.fastapi_app.include_router(import_router(name))
+            self.loaded.add(name)
@@ -0,0 +1,272 @@
+import bisect
+import sys
+import threading
+import time
+
+# in-process request and query metrics, exported in the prometheus text
+# format by /metrics. every worker process keeps its own numbers, so scrape
+# each worker (or run a single one) to see all of them
+
+# histogram buckets in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# modules that run queries on behalf of a route. their frames are skipped when
+# naming a query, so it is named after the route function that built it
+_helper_modules = frozenset(
+    ("app.utils.metrics", "app.utils.db_utils", "app.pymysql.databaseConnection")
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [
+        f'{name}="{_escape(value)}"'
+        for name, value in (*zip(labelnames, values), *extra)
+    ]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        # label values -> count
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        # label values -> [per bucket counts (the last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self):
+        with self._lock:
+            values = {
+                labels: (list(counts), total)
+                for labels, (counts, total) in self._values.items()
+            }
+        for labels, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                yield (
+                    self.name + "_bucket",
+                    _format_labels(
+                        self.labelnames, labels, (("le", _format_value(float(bound))),)
+                    ),
+                    cumulative,
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            yield self.name + "_sum", label_text, total
+            yield self.name + "_count", label_text, cumulative
+
+
+# a metric whose values are read when /metrics is scraped, for numbers that
+# are already counted elsewhere (e.g. the cache stats). callback returns
+# {label values: value}
+class CallbackMetric:
+    def __init__(self, name, type, help, labelnames, callback):
+        self.name = name
+        self.type = type
+        self.help = help
+        self.labelnames = labelnames
+        self._callback = callback
+
+    def samples(self):
+        for labels, value in sorted(self._callback().items()):
+            yield self.name, _format_labels(self.labelnames, labels), value
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_latency = registry.register(
+    Histogram(
+        "retrogame_http_request_duration_seconds",
+        "Time spent handling a request, by route template",
+        ("method", "route", "status"),
+    )
+)
+query_latency = registry.register(
+    Histogram(
+        "retrogame_db_query_duration_seconds",
+        "Time spent executing a query, by query name",
+        ("query",),
+    )
+)
+query_rows = registry.register(
+    Counter(
+        "retrogame_db_query_rows_total",
+        "Rows read from query results, by query name",
+        ("query",),
+    )
+)
+query_errors = registry.register(
+    Counter(
+        "retrogame_db_query_errors_total",
+        "Queries that raised an error, by query name",
+        ("query",),
+    )
+)
+
+
+# name a query after the function that ran it and its sql verb, e.g.
+# get_game.select. helper modules are skipped so queries run through
+# db_utils are named after the route that built them
+def query_name(query):
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") in _helper_modules:
+        frame = frame.f_back
+    function = frame.f_code.co_name if frame is not None else "unknown"
+    words = query.split(None, 1) if isinstance(query, str) else ()
+    verb = words[0].lower() if words else "unknown"
+    return f"{function}.{verb}"
+
+
+# times every query and counts the rows read from it. wraps the cursors
+# handed out by the connection pool, so the routers need no changes
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        # name of the last query run, the rows fetched are counted against it
+        self._name = None
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def _run(self, method, query, args):
+        self._name = query_name(query)
+        started = time.perf_counter()
+        try:
+            return method(query, args)
+        except Exception:
+            query_errors.inc(self._name)
+            raise
+        finally:
+            query_latency.observe(time.perf_counter() - started, self._name)
+
+    def execute(self, query, args=None):
+        return self._run(self._cursor.execute, query, args)
+
+    def executemany(self, query, args):
+        return self._run(self._cursor.executemany, query, args)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            query_rows.inc(self._name)
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size)
+        query_rows.inc(self._name, amount=len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        query_rows.inc(self._name, amount=len(rows))
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._cursor.close()
+
+
+# records how long each request took, labelled with the route template
+# (/game/{id}) rather than the path, so ids do not blow up the label count
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router stores the matched route in the scope
+            route = scope.get("route")
+            request_latency.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                str(status),
+            )
@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from app.pymysql.databaseConnection import get_db_connection
+from app.pymysql.favouriteCounts import reconcile_favourite_counts
+from app.utils.reloading import ReloadingCopy
+
+# reload the counts from the database after this many seconds, so favourites
+# handled by other workers are picked up
+POPULARITY_TTL = float(os.getenv("POPULARITY_TTL", "300"))
+# seconds between reconciliations of game.favourite_count with the favourites
+# table, 0 to turn them off. off by default on vercel, where nothing runs
+# between requests; run python -m app.pymysql.favouriteCounts --reconcile
+# from a scheduled job there instead
+FAVOURITE_RECONCILE_INTERVAL = float(
+    os.getenv("FAVOURITE_RECONCILE_INTERVAL", "0" if os.getenv("VERCEL") else "3600")
+)
+
+
+# the rankings a game appears in: every game, its platform's and its genre's
+def ranking_keys(platform_id, genre_id):
+    return (None, ("platform", platform_id), ("genre", genre_id))
+
+
+# each game's favourite count, with the games ranked most favourited first
+# overall and per platform and genre. games nobody has favourited are left
+# out of the rankings. the change methods return False when they refer to a
+# game this copy does not know about
+class LeaderboardData:
+    def __init__(self):
+        # game_id -> (platform_id, genre_id)
+        self.games = {}
+        # game_id -> favourite count
+        self.counts = {}
+        # ranking key -> sorted [(-count, game_id)], so the most favourited
+        # game comes first and ties go to the lowest id
+        self.ranked = defaultdict(list)
+
+    def _rank(self, game_id):
+        count = self.counts.get(game_id, 0)
+        if count > 0:
+            for key in ranking_keys(*self.games[game_id]):
+                insort(self.ranked[key], (-count, game_id))
+
+    def _unrank(self, game_id):
+        count = self.counts.get(game_id, 0)
+        if count > 0:
+            for key in ranking_keys(*self.games[game_id]):
+                ranked = self.ranked[key]
+                del ranked[bisect_left(ranked, (-count, game_id))]
+                if not ranked:
+                    del self.ranked[key]
+
+    # add a game, or move it to another platform or genre
+    def put_game(self, game_id, platform_id, genre_id, count=None):
+        if game_id in self.games:
+            self._unrank(game_id)
+        self.games[game_id] = (platform_id, genre_id)
+        if count is not None:
+            self.counts[game_id] = count
+        self._rank(game_id)
+        return True
+
+    def remove_game(self, game_id):
+        if game_id in self.games:
+            self._unrank(game_id)
+            del self.games[game_id]
+            self.counts.pop(game_id, None)
+        return True
+
+    def add_favourites(self, game_id, change):
+        if game_id not in self.games:
+            return False
+        self._unrank(game_id)
+        self.counts[game_id] = max(self.counts.get(game_id, 0) + change, 0)
+        self._rank(game_id)
+        return True
+
+    # the n most favourited games as [(game_id, count)]. with both a platform
+    # and a genre, the shorter of their rankings is filtered by the other
+    def top(self, n, platform_id=None, genre_id=None):
+        keys = []
+        if platform_id is not None:
+            keys.append(("platform", platform_id))
+        if genre_id is not None:
+            keys.append(("genre", genre_id))
+        if not keys:
+            keys.append(None)
+        rankings = sorted((self.ranked.get(key, []) for key in keys), key=len)
+        top = []
+        for negative_count, game_id in rankings[0]:
+            game_platform, game_genre = self.games[game_id]
+            if (platform_id is None or game_platform == platform_id) and (
+                genre_id is None or game_genre == genre_id
+            ):
+                top.append((game_id, -negative_count))
+                if len(top) == n:
+                    break
+        return top
+
+
+def fetch_leaderboard():
+    data = LeaderboardData()
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(
+            "SELECT game_id, platform_id, genre_id, favourite_count FROM game"
+        )
+        for row in cursor.fetchall():
+            data.put_game(
+                row["game_id"],
+                row["platform_id"],
+                row["genre_id"],
+                row["favourite_count"],
+            )
+    finally:
+        connection.close()
+    return data
+
+
+# in-process copy of every game's favourite count, ranked for
+# /games/popular. it loads on first use, and the favourites and game write
+# handlers apply their changes to it once they have committed
+class Leaderboard(ReloadingCopy):
+    def __init__(self):
+        super().__init__(fetch_leaderboard, POPULARITY_TTL)
+
+    def put_game(self, game_id, platform_id, genre_id):
+        self._apply("put_game", game_id, platform_id, genre_id)
+
+    def remove_game(self, game_id):
+        self._apply("remove_game", game_id)
+
+    def add_favourites(self, game_id, change):
+        self._apply("add_favourites", game_id, change, additive=True)
+
+    def top(self, n, platform_id=None, genre_id=None):
+        self.ensure_loaded()
+        with self._lock:
+            return self._data.top(n, platform_id, genre_id)
+
+
+leaderboard = Leaderboard()
+
+
+# a background thread that reconciles the favourite counts every interval
+# seconds, starting one interval after it is started
+class FavouriteReconciler:
+    def __init__(self, interval=FAVOURITE_RECONCILE_INTERVAL):
+        self.interval = interval
+        self.last_run = None
+        self.corrected = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0:
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="favourite-reconcile", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                # try again next interval
+                print(e)
+
+    def run_once(self):
+        connection = get_db_connection()
+        try:
+            drifted = reconcile_favourite_counts(connection)
+        finally:
+            connection.close()
+        self.last_run = time.time()
+        self.corrected += len(drifted)
+        if drifted:
+            print(f"corrected {len(drifted)} favourite counts")
+            leaderboard.invalidate()
+        return drifted
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+favourite_reconciler = FavouriteReconciler()
@@ -0,0 +1,110 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import HTTPException, Request, status
+
+from app.utils.metrics import Counter, registry
+
+# requests rejected by a limiter, by limiter name
+rate_limited = registry.register(
+    Counter(
+        "retrogame_rate_limited_total",
+        "Requests rejected with 429, by limit",
+        ("limit",),
+    )
+)
+
+
+# token buckets keyed by client ip or email. each key may make `burst`
+# requests at once, refilled at `per_minute` a minute. buckets are kept in
+# least recently used order, so ones left idle are dropped from the front in
+# constant time. a bucket idle long enough to refill is full, so dropping it
+# forgets nothing
+class TokenBucketLimiter:
+    def __init__(self, name: str, per_minute: float, burst: int, max_keys=100000):
+        self.name = name
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_keys = max_keys
+        # seconds for an empty bucket to fill up again
+        self.idle_after = burst / self.rate
+        # key -> (tokens, updated_at), least recently used first
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    # take a token for key. returns 0 when allowed, otherwise the seconds
+    # until a token is available
+    def acquire(self, key) -> float:
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / self.rate
+
+    def _evict(self, now):
+        buckets = self._buckets
+        while buckets:
+            key, (_, updated_at) = next(iter(buckets.items()))
+            if now - updated_at < self.idle_after and len(buckets) < self.max_keys:
+                break
+            buckets.popitem(last=False)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def _limiter(name, default_per_minute, default_burst):
+    prefix = name.upper()
+    return TokenBucketLimiter(
+        name,
+        per_minute=float(os.getenv(f"{prefix}_PER_MINUTE", default_per_minute)),
+        burst=int(os.getenv(f"{prefix}_BURST", default_burst)),
+    )
+
+
+# limits for the bcrypt heavy routes. each can be set in the .env file, e.g.
+# LOGIN_IP_PER_MINUTE=20 and LOGIN_IP_BURST=10
+login_ip_limiter = _limiter("login_ip", "20", "10")
+login_email_limiter = _limiter("login_email", "5", "5")
+register_ip_limiter = _limiter("register_ip", "5", "5")
+register_email_limiter = _limiter("register_email", "3", "3")
+
+
+# the client address. run uvicorn with --proxy-headers behind a proxy so this
+# is the real client rather than the proxy
+def client_ip(request: Request):
+    return request.client.host if request.client else "unknown"
+
+
+# raise a 429 if key is over the limiter's rate
+def enforce(limiter: TokenBucketLimiter, key: str):
+    retry_after = limiter.acquire(key)
+    if retry_after:
+        rate_limited.inc(limiter.name)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail={"success": False, "message": "Too many attempts, try again later"},
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+# route dependencies checking the ip limit before any other work is done.
+# async so they run on the event loop rather than in the threadpool
+async def limit_login_ip(request: Request):
+    enforce(login_ip_limiter, client_ip(request))
+
+
+async def limit_register_ip(request: Request):
+    enforce(register_ip_limiter, client_ip(request))
+
+
+def email_key(email: str):
+    return email.strip().lower()
@@ -0,0 +1,83 @@
+import threading
+import time
+
+
+# an in-process copy of data read from the database, built by fetch() on
+# first use and rebuilt every ttl seconds so writes handled by other workers
+# are picked up. the write handlers apply their changes to it once they have
+# committed. a change is the name of a method on the object fetch() returns,
+# which returns False when the change points at something this copy does not
+# have (written by another worker), so the copy is reloaded
+class ReloadingCopy:
+    def __init__(self, fetch, ttl):
+        self._fetch = fetch
+        self.ttl = ttl
+        self._data = None
+        self._loaded_at = None
+        # changes that arrive while the copy is loading, replayed after
+        self._pending = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    # the change has committed already, so a failure applying it reloads the
+    # copy rather than failing the write. an additive change (adding to a
+    # count) is not replayed over a load, as the rows loaded may already
+    # include it; the loaded copy is marked stale instead
+    def _apply(self, change, *args, additive=False):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((change, args, additive))
+            if self._data is None:
+                return
+            try:
+                applied = getattr(self._data, change)(*args)
+            except Exception as e:
+                print(e)
+                applied = False
+            if not applied:
+                self._loaded_at = None
+
+    # throw the copy away, the next read reloads it
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    # load a fresh copy, then swap it in. reads keep using the old one (if
+    # any) until the new one is ready
+    def load(self):
+        with self._lock:
+            self._pending = []
+        try:
+            data = self._fetch()
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            stale = False
+            try:
+                for change, args, additive in self._pending:
+                    if additive:
+                        stale = True
+                    else:
+                        getattr(data, change)(*args)
+            except Exception as e:
+                # keep the rest of the copy, but load it again on the next read
+                print(e)
+                stale = True
+            finally:
+                self._pending = None
+            self._data = data
+            self._loaded_at = None if stale else time.monotonic()
+
+    def ensure_loaded(self):
+        if not self._is_stale():
+            return
+        with self._load_lock:
+            # another request may have loaded it while this one waited
+            if self._is_stale():
+                self.load()
+
+    def _is_stale(self):
+        loaded_at = self._loaded_at
+        return loaded_at is None or time.monotonic() - loaded_at > self.ttl
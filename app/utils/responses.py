@@ -0,0 +1,9 @@
+# a successful response, {"detail": detail} with status 200. that is the shape
+# success responses had when the routes raised HTTPException(200), so clients
+# reading response.detail keep working.
+# fastapi validates the content against the route's response_model and drops
+# any field the model does not list, so a stray column (a password hash from
+# a SELECT *) never reaches the client. it is then encoded with orjson, the
+# app's default response class
+def detail_response(detail):
+    return {"detail": detail}
@@ -0,0 +1,150 @@
+import math
+import os
+import re
+from collections import defaultdict
+
+from app.pymysql.databaseConnection import get_db_connection
+from app.utils.reloading import ReloadingCopy
+
+# rebuild from the database after this many seconds, so writes handled by
+# other workers are picked up
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "300"))
+# a word in the title counts this many times more than one in the description
+TITLE_WEIGHT = 3
+
+# whether the game table has a FULLTEXT index on (title, description), None
+# until it has been checked
+_fulltext_available = None
+
+_word_pattern = re.compile(r"\w+")
+_stop_words = frozenset(
+    "a an and are as at be by for from in is it of on or the to with".split()
+)
+
+
+def tokenize(text):
+    return [
+        word
+        for word in _word_pattern.findall(text.lower())
+        if len(word) > 1 and word not in _stop_words
+    ]
+
+
+# list a game under the words of its title and description
+def index_game(postings, documents, game_id, title, description):
+    unindex_game(postings, documents, game_id)
+    weights = defaultdict(int)
+    for word in tokenize(title):
+        weights[word] += TITLE_WEIGHT
+    for word in tokenize(description):
+        weights[word] += 1
+    for word, weight in weights.items():
+        postings[word][game_id] = weight
+    documents[game_id] = tuple(weights)
+
+
+def unindex_game(postings, documents, game_id):
+    for word in documents.pop(game_id, ()):
+        game_weights = postings[word]
+        game_weights.pop(game_id, None)
+        if not game_weights:
+            del postings[word]
+
+
+# the inverted index itself. the change methods always apply
+class SearchIndexData:
+    def __init__(self):
+        # word -> {game_id: weighted term frequency}
+        self.postings = defaultdict(dict)
+        # game_id -> words it is listed under, so it can be removed again
+        self.documents = {}
+
+    def add(self, game_id, title, description):
+        index_game(self.postings, self.documents, game_id, title, description)
+        return True
+
+    def remove(self, game_id):
+        unindex_game(self.postings, self.documents, game_id)
+        return True
+
+    # rank games for a query. returns [(game_id, score)] best first, with a
+    # tf-idf style score where rarer words count for more
+    def search(self, query):
+        words = set(tokenize(query))
+        total = len(self.documents) or 1
+        scores = defaultdict(float)
+        for word in words:
+            game_weights = self.postings.get(word)
+            if not game_weights:
+                continue
+            idf = math.log(1 + total / len(game_weights))
+            for game_id, weight in game_weights.items():
+                scores[game_id] += weight * idf
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+# load every game into a fresh index
+def fetch_search_index():
+    data = SearchIndexData()
+    connection = get_db_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute("SELECT game_id, title, description FROM game")
+        for row in cursor.fetchall():
+            data.add(row["game_id"], row["title"], row["description"])
+    finally:
+        connection.close()
+    return data
+
+
+# in-process inverted index over game titles and descriptions, used by
+# /games/search when the database has no FULLTEXT index. it is built on
+# first use and the game write handlers keep it current
+class SearchIndex(ReloadingCopy):
+    def __init__(self):
+        super().__init__(fetch_search_index, SEARCH_INDEX_TTL)
+
+    # keep the index current after a game is inserted or updated
+    def add(self, game_id, title, description):
+        self._apply("add", game_id, title, description)
+
+    # keep the index current after a game is deleted
+    def remove(self, game_id):
+        self._apply("remove", game_id)
+
+    def search(self, query):
+        self.ensure_loaded()
+        with self._lock:
+            return self._data.search(query)
+
+
+search_index = SearchIndex()
+
+
+# check once per process whether mysql can run the search itself
+def fulltext_available():
+    global _fulltext_available
+    if _fulltext_available is None:
+        try:
+            connection = get_db_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute("SHOW INDEX FROM game WHERE Index_type = 'FULLTEXT'")
+                rows = cursor.fetchall()
+            finally:
+                connection.close()
+        except Exception as e:
+            # not cached, the next search checks again
+            print(e)
+            return False
+        columns = defaultdict(set)
+        for row in rows:
+            columns[row["Key_name"]].add(row["Column_name"])
+        _fulltext_available = {"title", "description"} in columns.values()
+    return _fulltext_available
+
+
+# fall back to the in-process index, e.g. after the FULLTEXT index was dropped
+def mark_fulltext_unavailable():
+    global _fulltext_available
+    _fulltext_available = False
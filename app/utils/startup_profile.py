@@ -0,0 +1,169 @@
+import argparse
+import importlib
+import importlib.abc
+import sys
+import time
+import tracemalloc
+
+# run from the project root with:
+#   python -m app.utils.startup_profile              time and memory of each
+#                                                    module app.main imports
+#   python -m app.utils.startup_profile --top 50     show more modules
+#   python -m app.utils.startup_profile --no-memory  skip tracemalloc, which
+#                                                    slows every import down
+# set LAZY_ROUTERS=1 to profile the cold start the way vercel runs it
+
+
+# one imported module. the self figures leave out the modules it imported
+class ImportRecord:
+    def __init__(self, name):
+        self.name = name
+        self.total_time = 0.0
+        self.self_time = 0.0
+        self.total_memory = 0
+        self.self_memory = 0
+
+
+# a meta path finder that asks the other finders for each module and wraps
+# the loader it gets back, so every module is measured from creation to the
+# end of its body. imports nest, so a module's own figures are its total
+# minus the totals of the imports it made
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.records = []
+        # [record, started, memory at start, children time, children memory]
+        self._stack = []
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                spec.loader = _ProfiledLoader(self, spec.loader)
+            return spec
+        return None
+
+    def _memory(self):
+        return tracemalloc.get_traced_memory()[0] if self.trace_memory else 0
+
+    def enter(self, name):
+        record = ImportRecord(name)
+        self.records.append(record)
+        self._stack.append([record, time.perf_counter(), self._memory(), 0.0, 0])
+
+    def exit(self):
+        record, started, memory, children_time, children_memory = self._stack.pop()
+        record.total_time = time.perf_counter() - started
+        record.total_memory = self._memory() - memory
+        record.self_time = record.total_time - children_time
+        record.self_memory = record.total_memory - children_memory
+        if self._stack:
+            self._stack[-1][3] += record.total_time
+            self._stack[-1][4] += record.total_memory
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.meta_path.remove(self)
+        if self.trace_memory:
+            tracemalloc.stop()
+
+
+class _ProfiledLoader(importlib.abc.Loader):
+    def __init__(self, profiler, loader):
+        self.profiler = profiler
+        self.loader = loader
+
+    def create_module(self, spec):
+        self.profiler.enter(spec.name)
+        try:
+            return self.loader.create_module(spec)
+        except BaseException:
+            self.profiler.exit()
+            raise
+
+    def exec_module(self, module):
+        # put the real loader back first, as some modules read resources
+        # through it while their body runs
+        module.__spec__.loader = self.loader
+        module.__loader__ = self.loader
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.exit()
+
+
+# import a module in this process and return (records, seconds taken)
+def profile_import(module_name, trace_memory=True):
+    with ImportProfiler(trace_memory) as profiler:
+        started = time.perf_counter()
+        importlib.import_module(module_name)
+        elapsed = time.perf_counter() - started
+    return profiler.records, elapsed
+
+
+def print_report(records, elapsed, top, sort, trace_memory):
+    print(f"imported {len(records)} modules in {elapsed * 1000:.1f} ms")
+    if trace_memory:
+        memory = sum(record.self_memory for record in records)
+        print(f"memory still allocated by them: {memory / 1024:.0f} KiB")
+    key = {
+        "self": lambda record: record.self_time,
+        "total": lambda record: record.total_time,
+        "memory": lambda record: record.self_memory,
+    }[sort]
+    print()
+    print(f"{'self ms':>9} {'total ms':>9} {'self KiB':>9} {'total KiB':>9}  module")
+    for record in sorted(records, key=key, reverse=True)[:top]:
+        if trace_memory:
+            memory = (
+                f"{record.self_memory / 1024:9.0f} {record.total_memory / 1024:9.0f}"
+            )
+        else:
+            memory = f"{'-':>9} {'-':>9}"
+        print(
+            f"{record.self_time * 1000:9.2f} {record.total_time * 1000:9.2f} "
+            f"{memory}  {record.name}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time and memory taken by each module imported at startup"
+    )
+    parser.add_argument(
+        "module", nargs="?", default="app.main", help="module to import"
+    )
+    parser.add_argument("--top", type=int, default=25, help="modules to list")
+    parser.add_argument(
+        "--sort",
+        choices=("self", "total", "memory"),
+        default="self",
+        help="order by own time, time including imports, or own memory",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="do not trace memory, for more accurate times",
+    )
+    args = parser.parse_args(argv)
+
+    if args.module in sys.modules:
+        print(f"{args.module} is already imported, run this in a fresh process")
+        return 1
+    trace_memory = not args.no_memory
+    records, elapsed = profile_import(args.module, trace_memory)
+    print_report(records, elapsed, args.top, args.sort, trace_memory)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,536 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# the app reads its jwt secrets at import time, so give it throwaway ones
+# before anything from app/ is imported
+os.environ.setdefault("JWT_SECRET_KEY", "benchmark-access-secret")
+os.environ.setdefault("JWT_REFRESH_SECRET_KEY", "benchmark-refresh-secret")
+# every benchmark request comes from one address, so lift the login limits
+for limit in ("LOGIN_IP", "LOGIN_EMAIL", "REGISTER_IP", "REGISTER_EMAIL"):
+    os.environ.setdefault(f"{limit}_PER_MINUTE", "1000000")
+    os.environ.setdefault(f"{limit}_BURST", "1000000")
+
+import httpx  # noqa: E402
+
+from benchmarks.seed import seed  # noqa: E402
+from benchmarks.standin import StandinDatabase  # noqa: E402
+
+# run from the project root with:
+#   python -m benchmarks.run
+#   python -m benchmarks.run --games 20000 --concurrency 1,16,64
+#   python -m benchmarks.run --compare benchmarks/results/baseline.json
+# see --help, and the benchmarks section of the README
+
+PASSWORD = "benchmark-password"
+DEFAULT_OUTPUT = os.path.join("benchmarks", "results", "latest.json")
+
+
+# counts the queries the app runs, to report queries per request
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, amount=1):
+        with self._lock:
+            self.count += amount
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, query, args=None):
+        self._counter.add()
+        return self._cursor.execute(query, args)
+
+    def executemany(self, query, args):
+        self._counter.add()
+        return self._cursor.executemany(query, args)
+
+
+class CountingConnection:
+    def __init__(self, connection, counter):
+        self._connection = connection
+        self._counter = counter
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self._connection.cursor(*args, **kwargs), self._counter)
+
+
+# the requests the benchmark sends. path and body are built per request from
+# the request number, so every run sends the same sequence. "scale" lowers the
+# request count for routes that are slow on purpose (bcrypt, full exports)
+def build_scenarios(args):
+    rng = random.Random(7)
+    lookup = args.lookup_size
+    games = args.games
+    users = args.users
+    words = ["dragon", "quest", "space", "ninja", "castle", "racer", "wizard"]
+
+    def game_id():
+        return rng.randint(1, games)
+
+    def lookup_id():
+        return rng.randint(1, lookup)
+
+    def user_number():
+        return rng.randint(2, users)
+
+    scenarios = [
+        {"name": "root", "router": "main", "path": lambda: "/"},
+        {
+            "name": "games page",
+            "router": "game",
+            "path": lambda: "/games/?limit=50&facets=false",
+        },
+        {
+            "name": "games page with facets",
+            "router": "game",
+            "path": lambda: "/games/?limit=50",
+        },
+        {
+            "name": "games filtered",
+            "router": "game",
+            "path": lambda: f"/games/?limit=50&platform_id={lookup_id()}&min_year=1985&max_year=1995",
+        },
+        {
+            "name": "game detail",
+            "router": "game",
+            "path": lambda: f"/game/{game_id()}",
+        },
+        {
+            "name": "games batch of 20",
+            "router": "game",
+            "path": lambda: "/games/batch?ids="
+            + ",".join(str(game_id()) for _ in range(20)),
+        },
+        {
+            "name": "games search",
+            "router": "game",
+            "path": lambda: "/games/search?q=" + "+".join(rng.sample(words, 2)),
+        },
+        {
+            "name": "popular games",
+            "router": "game",
+            "path": lambda: f"/games/popular?limit=20&platform_id={lookup_id()}",
+        },
+        {
+            "name": "games export",
+            "router": "game",
+            "path": lambda: "/games/export",
+            "scale": 0.02,
+        },
+        {
+            "name": "favourites list",
+            "router": "favourites",
+            "path": lambda: "/favourites/",
+            "user": user_number,
+        },
+        {
+            "name": "favourite check",
+            "router": "favourites",
+            "path": lambda: f"/favourites/{game_id()}",
+            "user": user_number,
+        },
+        {
+            "name": "rating summary",
+            "router": "ratings",
+            "path": lambda: f"/ratings/{game_id()}",
+        },
+        {
+            "name": "users me",
+            "router": "users",
+            "path": lambda: "/users/me/",
+            "user": user_number,
+        },
+        {
+            "name": "users login",
+            "router": "users",
+            "method": "POST",
+            "path": lambda: "/users/login",
+            "form": lambda: {
+                "username": f"player{user_number()}@example.com",
+                "password": PASSWORD,
+            },
+            "scale": 0.05,
+        },
+        {
+            "name": "token refresh",
+            "router": "token",
+            "method": "POST",
+            "path": lambda: "/token/refresh?refresh_token={refresh_token}",
+            "scale": 0.2,
+        },
+    ]
+    for table, plural in (
+        ("platform", "platforms"),
+        ("genre", "genres"),
+        ("developer", "developers"),
+        ("publisher", "publishers"),
+    ):
+        scenarios += [
+            {
+                "name": f"{table} list",
+                "router": table,
+                "path": lambda plural=plural: f"/{plural}/",
+            },
+            {
+                "name": f"{table} data",
+                "router": table,
+                "path": lambda table=table: f"/{table}-data/{lookup_id()}",
+            },
+            {
+                "name": f"{table} games",
+                "router": table,
+                "path": lambda table=table: f"/{table}/{lookup_id()}?limit=50",
+            },
+        ]
+    # one write, which also exercises the cache invalidation paths
+    scenarios.append(
+        {
+            "name": "genre rename",
+            "router": "genre",
+            "method": "PUT",
+            "path": lambda: "/genre/1",
+            "json": lambda: {"name": "Genre 1"},
+            "user": lambda: 1,
+            "scale": 0.2,
+        }
+    )
+    return scenarios
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def send(client, scenario, tokens):
+    method = scenario.get("method", "GET")
+    path = scenario["path"]().format(refresh_token=tokens["refresh"])
+    headers = {}
+    if "user" in scenario:
+        headers["Authorization"] = "Bearer " + tokens["access"](scenario["user"]())
+    kwargs = {}
+    if "form" in scenario:
+        kwargs["data"] = scenario["form"]()
+    if "json" in scenario:
+        kwargs["json"] = scenario["json"]()
+    started = time.perf_counter()
+    response = await client.request(method, path, headers=headers, **kwargs)
+    await response.aread()
+    # bytes as sent, before the client decompresses them
+    return (
+        time.perf_counter() - started,
+        response.status_code,
+        response.num_bytes_downloaded,
+    )
+
+
+async def run_scenario(client, scenario, concurrency, requests, tokens, counter):
+    total = max(concurrency, int(requests * scenario.get("scale", 1)))
+    latencies = []
+    statuses = {}
+    downloaded = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal downloaded
+        for _ in remaining:
+            latency, status_code, size = await send(client, scenario, tokens)
+            latencies.append(latency)
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+            downloaded += size
+
+    # a few unmeasured requests first so lazy setup is not counted
+    for _ in range(min(3, total)):
+        await send(client, scenario, tokens)
+
+    counter.reset()
+    started = time.perf_counter()
+    # cpu time of the whole process, app and stand-in database together
+    cpu_started = time.process_time()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    errors = sum(count for code, count in statuses.items() if code >= 400)
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": total / elapsed,
+        "queries_per_request": counter.count / total,
+        "cpu_ms_per_request": cpu / total * 1000,
+        "kb_per_request": downloaded / total / 1024,
+    }
+
+
+def print_table(results):
+    print(
+        f"{'scenario':<26}{'conc':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        f"{'req/s':>10}{'cpu ms':>8}{'kB/req':>8}{'q/req':>7}{'errors':>8}"
+    )
+    for name, by_concurrency in results.items():
+        for concurrency, stats in by_concurrency.items():
+            print(
+                f"{name:<26}{concurrency:>5}{stats['p50_ms']:>10.2f}"
+                f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+                f"{stats['throughput_rps']:>10.1f}"
+                f"{stats.get('cpu_ms_per_request', 0):>8.2f}"
+                f"{stats.get('kb_per_request', 0):>8.1f}"
+                f"{stats['queries_per_request']:>7.2f}{stats['errors']:>8}"
+            )
+
+
+# flag scenarios whose p95 latency or throughput got worse than the baseline
+# by more than the threshold. returns the regressions found
+def compare(results, baseline, threshold):
+    regressions = []
+    print(f"\ncompared with baseline (threshold {threshold:.0%}):")
+    for name, by_concurrency in results.items():
+        for concurrency, stats in by_concurrency.items():
+            before = baseline["results"].get(name, {}).get(concurrency)
+            if before is None:
+                continue
+            p95_change = stats["p95_ms"] / before["p95_ms"] - 1
+            rps_change = stats["throughput_rps"] / before["throughput_rps"] - 1
+            cpu_change = ""
+            if "cpu_ms_per_request" in before:
+                cpu_change = (
+                    f"  cpu/req "
+                    f"{stats['cpu_ms_per_request'] / before['cpu_ms_per_request'] - 1:+7.1%}"
+                )
+            flag = ""
+            if p95_change > threshold or rps_change < -threshold:
+                flag = "  REGRESSION"
+                regressions.append((name, concurrency))
+            print(
+                f"{name:<26}{concurrency:>5}  p95 {p95_change:+7.1%}"
+                f"  req/s {rps_change:+7.1%}{cpu_change}{flag}"
+            )
+    return regressions
+
+
+def setup_database(args, counter):
+    from app.pymysql import databaseConnection
+    from app.utils.auth_utils import get_password_hash
+
+    password_hash = get_password_hash(PASSWORD)
+    standin = None
+    if args.database == "mysql":
+        from app.pymysql.migrate import run_migrations
+
+        connect = databaseConnection.create_db_connection
+        connection = connect()
+        run_migrations(connection)
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) AS games FROM game")
+        existing = cursor.fetchone()["games"]
+        if existing and not args.no_seed:
+            connection.close()
+            sys.exit(
+                "the database already has games. point MYSQL_DATABASE at an empty "
+                "database, or pass --no-seed to benchmark the existing data"
+            )
+    else:
+        standin = StandinDatabase()
+        connect = standin.connect
+        connection = connect()
+
+    if not args.no_seed:
+        print(
+            f"seeding {args.games} games, {args.users} users and "
+            f"{args.favourites} favourites"
+        )
+        seed(
+            connection,
+            games=args.games,
+            users=args.users,
+            favourites=args.favourites,
+            lookup_size=args.lookup_size,
+            password_hash=password_hash,
+        )
+    connection.close()
+
+    databaseConnection._pool = databaseConnection.ConnectionPool(
+        connect=lambda: CountingConnection(connect(), counter),
+        min_size=1,
+        max_size=args.pool_size,
+    )
+    return standin
+
+
+async def run(args, counter):
+    from app.main import app
+    from app.utils.auth_utils import create_access_token, create_refresh_token
+
+    access_tokens = {}
+
+    def access_token(user_number):
+        if user_number not in access_tokens:
+            access_tokens[user_number] = create_access_token(
+                {"sub": f"player{user_number}@example.com"}
+            )
+        return access_tokens[user_number]
+
+    tokens = {
+        "access": access_token,
+        "refresh": create_refresh_token({"sub": "player2@example.com"}),
+    }
+    only = set(args.only.split(",")) if args.only else None
+    scenarios = [
+        scenario
+        for scenario in build_scenarios(args)
+        if only is None or scenario["name"] in only or scenario["router"] in only
+    ]
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://benchmark"
+    ) as client:
+        if args.accept_encoding is not None:
+            client.headers["Accept-Encoding"] = args.accept_encoding
+        for scenario in scenarios:
+            results[scenario["name"]] = {}
+            for concurrency in args.concurrency:
+                stats = await run_scenario(
+                    client, scenario, concurrency, args.requests, tokens, counter
+                )
+                results[scenario["name"]][str(concurrency)] = stats
+                print(
+                    f"  {scenario['name']:<26} c={concurrency:<4} "
+                    f"p95 {stats['p95_ms']:8.2f} ms  {stats['throughput_rps']:8.1f} req/s"
+                )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="RetroGame API endpoint benchmarks")
+    parser.add_argument("--games", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--favourites", type=int, default=5000)
+    parser.add_argument(
+        "--lookup-size",
+        type=int,
+        default=25,
+        help="rows in each of genre, platform, publisher and developer",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(part) for part in value.split(",")],
+        default=[1, 8, 32],
+        help="comma separated concurrency levels",
+    )
+    parser.add_argument(
+        "--requests", type=int, default=200, help="requests per scenario and level"
+    )
+    parser.add_argument("--pool-size", type=int, default=10)
+    parser.add_argument(
+        "--database",
+        choices=("standin", "mysql"),
+        default="standin",
+        help="standin is an in-process sqlite database; mysql uses the MYSQL_* "
+        "settings from .env, which must point at a disposable database",
+    )
+    parser.add_argument(
+        "--no-seed", action="store_true", help="benchmark the data already there"
+    )
+    parser.add_argument(
+        "--catalog-engine",
+        choices=("sql", "memory"),
+        default=os.getenv("CATALOG_ENGINE", "sql"),
+        help="where the game listings are read from, see CATALOG_ENGINE",
+    )
+    parser.add_argument(
+        "--only", help="comma separated scenario or router names to run"
+    )
+    parser.add_argument(
+        "--accept-encoding",
+        help="Accept-Encoding header to send, e.g. identity to turn off "
+        "compression. defaults to what httpx sends",
+    )
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", help="baseline json written by an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="relative change counted as a regression when comparing",
+    )
+    args = parser.parse_args(argv)
+    # read by the app when it is imported
+    os.environ["CATALOG_ENGINE"] = args.catalog_engine
+
+    counter = QueryCounter()
+    standin = setup_database(args, counter)
+    try:
+        results = asyncio.run(run(args, counter))
+    finally:
+        if standin is not None:
+            standin.remove()
+
+    print()
+    print_table(results)
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "database": args.database,
+            "catalog_engine": args.catalog_engine,
+            "accept_encoding": args.accept_encoding,
+            "games": args.games,
+            "users": args.users,
+            "favourites": args.favourites,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"\nresults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import random
+from datetime import datetime, timedelta
+
+from app.pymysql.favouriteCounts import reconcile_favourite_counts
+from app.pymysql.gameCards import rebuild_game_cards
+
+# words the synthetic titles and descriptions are made from, so searches and
+# filters have something realistic to match
+TITLE_WORDS = (
+    "super mega pixel turbo dragon quest knight ninja space star galaxy "
+    "racer fighter legend castle shadow thunder blaster hero kart puzzle "
+    "saga force dungeon rocket wizard arcade"
+).split()
+DESCRIPTION_WORDS = (
+    "explore battle jump collect race solve defeat rescue build fly dungeons "
+    "levels bosses worlds coins power ups secrets cartridge console retro "
+    "classic adventure multiplayer soundtrack sprites scrolling platform"
+).split()
+
+LOOKUP_TABLES = ("genre", "platform", "publisher", "developer")
+
+
+def _chunks(rows, size=1000):
+    for start in range(0, len(rows), size):
+        yield rows[start : start + size]
+
+
+# fill an empty database with a synthetic catalog. password_hash is stored for
+# every user, so the benchmark can log in with one known password
+def seed(
+    connection,
+    games=5000,
+    users=200,
+    favourites=5000,
+    lookup_size=25,
+    password_hash="",
+    random_seed=1,
+):
+    rng = random.Random(random_seed)
+    cursor = connection.cursor()
+
+    for table in LOOKUP_TABLES:
+        rows = [(f"{table.title()} {number}",) for number in range(1, lookup_size + 1)]
+        cursor.executemany(f"INSERT INTO {table} (name) VALUES (%s)", rows)
+    connection.commit()
+
+    game_rows = []
+    for number in range(1, games + 1):
+        title = " ".join(rng.sample(TITLE_WORDS, 3)).title() + f" {number}"
+        description = " ".join(rng.choices(DESCRIPTION_WORDS, k=40))
+        game_rows.append(
+            (
+                title,
+                description,
+                rng.randint(1977, 2005),
+                rng.randint(1, lookup_size),
+                rng.randint(1, lookup_size),
+                rng.randint(1, lookup_size),
+                rng.randint(1, lookup_size),
+                f"https://example.com/covers/{number}.png",
+            )
+        )
+    for chunk in _chunks(game_rows):
+        cursor.executemany(
+            "INSERT INTO game (title, description, release_year, genre_id, platform_id, publisher_id, developer_id, image_url) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+            chunk,
+        )
+    connection.commit()
+    # the listings read the game_card read model, built from the games above
+    rebuild_game_cards(connection)
+
+    join_date = datetime(2024, 1, 1)
+    user_rows = [
+        (
+            f"player{number}",
+            f"player{number}@example.com",
+            password_hash,
+            "admin" if number == 1 else "user",
+            (join_date + timedelta(hours=number)).strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        for number in range(1, users + 1)
+    ]
+    cursor.executemany(
+        "INSERT INTO users (username, email, password, role, join_date) VALUES (%s, %s, %s, %s, %s)",
+        user_rows,
+    )
+    connection.commit()
+
+    pairs = set()
+    favourites = min(favourites, games * users)
+    while len(pairs) < favourites:
+        pairs.add((rng.randint(1, users), rng.randint(1, games)))
+    timestamp = join_date.strftime("%Y-%m-%d %H:%M:%S")
+    for chunk in _chunks(sorted(pairs)):
+        cursor.executemany(
+            "INSERT INTO favourites (user_id, game_id, timestamp) VALUES (%s, %s, %s)",
+            [(user_id, game_id, timestamp) for user_id, game_id in chunk],
+        )
+    connection.commit()
+    cursor.close()
+    # /games/popular reads the counts, not the favourites above
+    reconcile_favourite_counts(connection)
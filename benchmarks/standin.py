@@ -0,0 +1,220 @@
+import os
+import re
+import sqlite3
+import tempfile
+
+# an in-process stand-in for the mysql database, backed by sqlite, so the
+# benchmarks can run without a database server. it speaks the small part of
+# the pymysql api the app uses: dict rows, %s placeholders, commit/rollback,
+# ping and lastrowid. mysql only features (FULLTEXT, SHOW INDEX) raise, which
+# makes the app take its in-process fallbacks
+
+SCHEMA = """
+CREATE TABLE platform(
+    platform_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE,
+    logo_url VARCHAR(255)
+);
+CREATE TABLE publisher(
+    publisher_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE
+);
+CREATE TABLE developer(
+    developer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE
+);
+CREATE TABLE genre(
+    genre_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100) NOT NULL UNIQUE
+);
+CREATE TABLE game(
+    game_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title VARCHAR(255) NOT NULL,
+    description TEXT NOT NULL,
+    release_year INT NOT NULL,
+    genre_id INT NOT NULL REFERENCES genre(genre_id),
+    platform_id INT NOT NULL REFERENCES platform(platform_id),
+    publisher_id INT NOT NULL REFERENCES publisher(publisher_id),
+    developer_id INT NOT NULL REFERENCES developer(developer_id),
+    image_url VARCHAR(255),
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0,
+    rating_1 INT NOT NULL DEFAULT 0,
+    rating_2 INT NOT NULL DEFAULT 0,
+    rating_3 INT NOT NULL DEFAULT 0,
+    rating_4 INT NOT NULL DEFAULT 0,
+    rating_5 INT NOT NULL DEFAULT 0,
+    favourite_count INT NOT NULL DEFAULT 0
+);
+CREATE INDEX idx_game_platform_game ON game(platform_id, game_id);
+CREATE INDEX idx_game_genre_game ON game(genre_id, game_id);
+CREATE INDEX idx_game_publisher_game ON game(publisher_id, game_id);
+CREATE INDEX idx_game_developer_game ON game(developer_id, game_id);
+CREATE INDEX idx_game_release_year ON game(release_year);
+CREATE TABLE game_card(
+    game_id INTEGER PRIMARY KEY,
+    title VARCHAR(255) NOT NULL,
+    description TEXT NOT NULL,
+    release_year INT NOT NULL,
+    genre_id INT NOT NULL,
+    genre_name VARCHAR(100) NOT NULL,
+    platform_id INT NOT NULL,
+    platform_name VARCHAR(100) NOT NULL,
+    publisher_id INT NOT NULL,
+    publisher_name VARCHAR(100) NOT NULL,
+    developer_id INT NOT NULL,
+    developer_name VARCHAR(100) NOT NULL,
+    image_url VARCHAR(255),
+    rating_count INT NOT NULL DEFAULT 0,
+    rating_sum INT NOT NULL DEFAULT 0
+);
+CREATE INDEX idx_game_card_platform_game ON game_card(platform_id, game_id);
+CREATE INDEX idx_game_card_genre_game ON game_card(genre_id, game_id);
+CREATE INDEX idx_game_card_publisher_game ON game_card(publisher_id, game_id);
+CREATE INDEX idx_game_card_developer_game ON game_card(developer_id, game_id);
+CREATE TABLE users(
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username VARCHAR(50) NOT NULL UNIQUE,
+    email VARCHAR(100) NOT NULL UNIQUE,
+    password VARCHAR(255) NOT NULL,
+    role VARCHAR(6) NOT NULL DEFAULT 'user',
+    join_date DATETIME NOT NULL
+);
+CREATE TABLE ratings(
+    rating_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    game_id INT NOT NULL REFERENCES game(game_id),
+    user_id INT NOT NULL REFERENCES users(user_id),
+    score INT NOT NULL CHECK (score BETWEEN 1 AND 5),
+    timestamp DATETIME NOT NULL
+);
+CREATE UNIQUE INDEX uq_ratings_user_game ON ratings(user_id, game_id);
+CREATE TABLE favourites(
+    favourite_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT NOT NULL REFERENCES users(user_id),
+    game_id INT NOT NULL REFERENCES game(game_id),
+    timestamp DATETIME NOT NULL
+);
+CREATE UNIQUE INDEX uq_favourites_user_game ON favourites(user_id, game_id);
+"""
+
+_for_update = re.compile(r"\s+FOR\s+UPDATE", re.IGNORECASE)
+_insert_ignore = re.compile(r"^\s*INSERT\s+IGNORE", re.IGNORECASE)
+
+
+# rewrite the mysql flavoured sql the routers use into sqlite
+def translate(query):
+    query = query.replace("%s", "?")
+    query = _for_update.sub("", query)
+    query = _insert_ignore.sub("INSERT OR IGNORE", query)
+    return query
+
+
+def _floor(value):
+    return None if value is None else int(value // 1)
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._db.cursor()
+        self.lastrowid = None
+        self.rowcount = -1
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def execute(self, query, args=None):
+        if args is not None and not isinstance(args, (tuple, list, dict)):
+            args = (args,)
+        self._cursor.execute(translate(query), args or ())
+        self.lastrowid = self._cursor.lastrowid
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def executemany(self, query, args):
+        args = list(args)
+        if args:
+            self._cursor.executemany(translate(query), args)
+        self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def _to_dict(self, row):
+        if row is None:
+            return None
+        return {column[0]: value for column, value in zip(self.description, row)}
+
+    def fetchone(self):
+        return self._to_dict(self._cursor.fetchone())
+
+    def fetchmany(self, size=1):
+        return [self._to_dict(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._to_dict(row) for row in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.create_function("FLOOR", 1, _floor, deterministic=True)
+
+    # the cursor class is ignored, rows are always dicts and always buffered
+    def cursor(self, cursorclass=None):
+        return Cursor(self)
+
+    def begin(self):
+        pass
+
+    def commit(self):
+        self._db.commit()
+
+    def rollback(self):
+        self._db.rollback()
+
+    def ping(self, reconnect=True):
+        self._db.execute("SELECT 1")
+
+    def close(self):
+        self._db.close()
+
+
+class StandinDatabase:
+    def __init__(self, path=None):
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix="retrogame-bench-", suffix=".db")
+            os.close(handle)
+            self._temporary = True
+        else:
+            self._temporary = False
+        self.path = path
+        db = sqlite3.connect(path)
+        # wal lets readers carry on while a writer commits
+        db.execute("PRAGMA journal_mode = WAL")
+        db.executescript(SCHEMA)
+        db.close()
+
+    # connection factory for the app's ConnectionPool
+    def connect(self):
+        return Connection(self.path)
+
+    def remove(self):
+        if self._temporary:
+            for suffix in ("", "-wal", "-shm"):
+                try:
+                    os.remove(self.path + suffix)
+                except FileNotFoundError:
+                    pass
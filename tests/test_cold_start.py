@@ -0,0 +1,59 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# milliseconds importing app.main may take on top of fastapi and pydantic,
+# which are needed whatever the app does. raise it on a slow machine with
+# COLD_START_BUDGET_MS
+COLD_START_BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", "150"))
+
+# modules that must not be imported until a request needs them
+DEFERRED_MODULES = ("passlib", "jwt", "app.models.Responses", "app.routers.game")
+
+# imports the app the way a vercel cold start does and prints the time the
+# app's own imports took, the deferred modules that got imported anyway, and
+# whether a connection pool was created
+IMPORT_APP = f"""
+import sys, time
+import fastapi, fastapi.security, pydantic
+started = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - started
+from app.pymysql import databaseConnection
+print(elapsed * 1000)
+print(",".join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))
+print(databaseConnection._pool is None)
+"""
+
+
+def import_app():
+    env = {**os.environ, "LAZY_ROUTERS": "1"}
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_APP],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    elapsed, imported, no_pool = result.stdout.strip().splitlines()[-3:]
+    return float(elapsed), [name for name in imported.split(",") if name], no_pool
+
+
+def test_cold_start_within_budget():
+    # best of three, so one slow run on a busy machine does not fail it
+    elapsed = min(import_app()[0] for _ in range(3))
+    assert elapsed <= COLD_START_BUDGET_MS, (
+        f"importing app.main took {elapsed:.0f} ms, over the "
+        f"{COLD_START_BUDGET_MS:.0f} ms budget. run "
+        "LAZY_ROUTERS=1 python -m app.utils.startup_profile to see why"
+    )
+
+
+def test_cold_start_defers_heavy_work():
+    _, imported, no_pool = import_app()
+    assert imported == []
+    assert no_pool == "True"